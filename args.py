@@ -1,8 +1,8 @@
 import argparse
 from bs4 import BeautifulSoup
 import random
-from urllib.request import Request, urlopen
-from config import headers
+from transport import get_client
+from config import BATCH_WORKERS
 import re
 
 
@@ -19,7 +19,29 @@ def get_parser():
         "--file",
         type=str,
         default="",
-        help="Path to a file containing a list of Jable TV URLs (one URL per line)",
+        help="Path to a file containing a list of Jable TV URLs (one URL per line, optionally followed by a priority)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=BATCH_WORKERS,
+        help="Number of titles to download concurrently in batch mode",
+    )
+    parser.add_argument(
+        "--bench-encode",
+        action="store_true",
+        help="Benchmark every encode profile on a synthetic clip and pick one for batch mode",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write a cProfile .pstats file into each title's folder",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Serve Prometheus metrics on this local port (/metrics, /metrics.json); 0 disables",
     )
 
     return parser
@@ -28,8 +50,7 @@ def get_parser():
 def av_recommand():
     headers = {"User-Agent": "Mozilla/5.0"}
     url = "https://jable.tv/"
-    request = Request(url, headers=headers)
-    web_content = urlopen(request).read()
+    web_content = get_client().get(url, headers=headers).content
     # 得到繞過轉址後的 html
     soup = BeautifulSoup(web_content, "html.parser")
     h6_tags = soup.find_all("h6", class_="title")
@@ -0,0 +1,180 @@
+"""以本機合成的 HLS 影片測量下載流程的效能
+
+    python benchmark.py --segments 300 --size 524288 --latency 0.05 --bandwidth 2000000
+
+合成影片由 hlsserver 提供, 走與實際下載相同的 m3u8 -> 金鑰 -> prepareCrawl -> 合成 -> 轉檔流程,
+最後印出各階段耗時, 下載速度, CPU 時間與最高記憶體用量, 並核對輸出檔的雜湊.
+"""
+import os
+import sys
+import glob
+import time
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+import m3u8
+from urllib.parse import urljoin
+from config import STREAM_MERGE
+from transport import get_client
+from crawler import prepareCrawl
+from merge import mergeMp4
+from delete import deleteMp4
+from encode import ffmpegEncode
+from encodebench import makeClip
+from download import segmentKeys
+from timing import StageTimer
+from hlsserver import HlsServer, SyntheticTitle
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peakRss():
+    """本行程目前為止的最高記憶體用量 (MB), 平台不支援時回傳 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1048576 if sys.platform == "darwin" else 1024)
+
+
+def mediaPayload(segments, duration, workDir):
+    # 以 ffmpeg 產生真實的 MPEG-TS 片段, 合成後可以實際轉檔
+    clip = os.path.join(workDir, "clip.ts")
+    makeClip(clip, segments * duration)
+    subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error', '-i', clip, '-c', 'copy',
+                           '-f', 'segment', '-segment_time', str(duration),
+                           os.path.join(workDir, 'media_%05d.ts')])
+    payload = []
+    for path in sorted(glob.glob(os.path.join(workDir, 'media_*.ts'))):
+        with open(path, 'rb') as f:
+            payload.append(f.read())
+    return payload
+
+
+def runPipeline(m3u8url, folderPath, stream=STREAM_MERGE, encode=0, timer=None):
+    """對一個 m3u8 網址跑完整的下載流程, 回傳輸出檔路徑"""
+    timer = timer or StageTimer(os.path.basename(folderPath))
+    dirName = os.path.basename(folderPath)
+    outputPath = os.path.join(folderPath, dirName + ".mp4")
+    os.makedirs(folderPath, exist_ok=True)
+
+    with timer.stage("m3u8"):
+        response = get_client().get(m3u8url)
+        response.raise_for_status()
+        m3u8obj = m3u8.loads(response.text, uri=m3u8url)
+    tsList = [urljoin(m3u8url, seg.uri) for seg in m3u8obj.segments]
+    with timer.stage("keys"):
+        keys, _ = segmentKeys(m3u8obj, m3u8url)
+
+    if stream:
+        with timer.stage("download"):
+            prepareCrawl(keys, folderPath, tsList, outputPath=outputPath, timer=timer)
+    else:
+        with timer.stage("download"):
+            prepareCrawl(keys, folderPath, tsList, timer=timer)
+        with timer.stage("merge"):
+            mergeMp4(folderPath, tsList)
+        with timer.stage("delete"):
+            deleteMp4(folderPath)
+
+    if encode:
+        with timer.stage("encode"):
+            if not ffmpegEncode(folderPath, dirName, encode):
+                raise RuntimeError("轉檔失敗")
+    return outputPath
+
+
+def fileDigest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1048576), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def runBenchmark(segments, size, latency, bandwidth, stream, encode=0, media=False, seed=0):
+    workDir = tempfile.mkdtemp(prefix="jable_bench_")
+    try:
+        payload = mediaPayload(segments, 4, workDir) if media else None
+        title = SyntheticTitle("bench", segments, size, seed=seed, payload=payload)
+        timer = StageTimer(title.name)
+        with HlsServer([title], latency=latency, bandwidth=bandwidth) as server:
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            children = os.times()
+            outputPath = runPipeline(
+                server.url(title.name), os.path.join(workDir, title.name), stream, encode, timer
+            )
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            childCpu = sum(os.times()[2:4]) - sum(children[2:4])
+            requests = server.requests
+
+        downloadWall = timer.stages["download"][0]
+        result = {
+            "segments": len(title.segments),
+            "bytes": title.size,
+            "latency": latency,
+            "bandwidth": bandwidth,
+            "stream": stream,
+            "encode": encode,
+            "requests": requests,
+            "wall_seconds": round(wall, 3),
+            "download_mb_per_second": round(title.size / downloadWall / 1048576, 2),
+            "cpu_seconds": round(cpu, 3),
+            "child_cpu_seconds": round(childCpu, 3),
+            "peak_rss_mb": round(peakRss(), 1) if resource else None,
+            "stages": {name: [round(v, 3) for v in stage[:2]] for name, stage in timer.stages.items()},
+            # 轉檔後內容會改變, 只在未轉檔時核對
+            "verified": None if encode else fileDigest(outputPath) == title.digest,
+        }
+        timer.report()
+        return result
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+
+def printResult(result):
+    print("\n" + "=" * 60)
+    print(f"片段 {result['segments']} 個, 共 {result['bytes'] / 1048576:.1f} MB, 請求 {result['requests']} 次")
+    print(f"延遲 {result['latency']} 秒, 頻寬 {result['bandwidth'] or '不限'}, 串流合成 {result['stream']}")
+    print(f"總耗時 {result['wall_seconds']:.2f} 秒, 下載速度 {result['download_mb_per_second']:.2f} MB/s")
+    print(f"CPU {result['cpu_seconds']:.2f} 秒 (子行程 {result['child_cpu_seconds']:.2f} 秒), "
+          f"最高記憶體 {result['peak_rss_mb']} MB")
+    print(f"輸出檔驗證: {'略過' if result['verified'] is None else ('通過' if result['verified'] else '失敗')}")
+    print("=" * 60)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the download pipeline against a local synthetic HLS server")
+    parser.add_argument("--segments", type=int, default=200, help="Number of segments")
+    parser.add_argument("--size", type=int, default=512 * 1024, help="Plaintext bytes per segment")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay before every response")
+    parser.add_argument("--bandwidth", type=int, default=0, help="Bytes per second per connection, 0 for unlimited")
+    parser.add_argument("--no-stream", action="store_true", help="Download segment files and merge instead of streaming")
+    parser.add_argument("--media", action="store_true", help="Serve real ffmpeg-generated MPEG-TS instead of random bytes")
+    parser.add_argument("--encode", type=int, default=0, help="Encode profile to run after merging (requires --media)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic title")
+    parser.add_argument("--json", type=str, default="", help="Also write the result to this JSON file")
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    if args.encode and not args.media:
+        sys.exit("--encode 需要搭配 --media, 隨機內容無法轉檔")
+    result = runBenchmark(
+        args.segments, args.size, args.latency, args.bandwidth,
+        not args.no_stream, args.encode, args.media, args.seed,
+    )
+    printResult(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if result["verified"] is False:
+        sys.exit(1)
@@ -0,0 +1,407 @@
+import os
+import re
+import atexit
+import sqlite3
+import datetime
+import threading
+from config import DB_PATH, DB_BUSY_TIMEOUT, DB_CACHE_MB
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+# id(連線) -> 是否可用全文索引; 連線都保留在 _connections 直到 closeAll, id 不會被重複使用
+_searchIndex = {}
+
+# 全文索引: 以 trigram 切詞, 中日文標題也能以任意子字串搜尋; 由觸發器與 av_db 保持同步
+FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS av_fts USING fts5(
+        fanhao, title, content='av_db', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS av_fts_insert AFTER INSERT ON av_db BEGIN
+        INSERT INTO av_fts(rowid, fanhao, title) VALUES (new.id, new.fanhao, new.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS av_fts_delete AFTER DELETE ON av_db BEGIN
+        INSERT INTO av_fts(av_fts, rowid, fanhao, title) VALUES ('delete', old.id, old.fanhao, old.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS av_fts_update AFTER UPDATE OF fanhao, title ON av_db BEGIN
+        INSERT INTO av_fts(av_fts, rowid, fanhao, title) VALUES ('delete', old.id, old.fanhao, old.title);
+        INSERT INTO av_fts(rowid, fanhao, title) VALUES (new.id, new.fanhao, new.title);
+    END
+    """,
+]
+
+# trigram 至少需要 3 個字元, 較短的關鍵字改用 LIKE
+TRIGRAM_MIN = 3
+
+# 番號: 片商前綴 + 編號 + 版本後綴, 例如 ipx486, IPX-486, ipx-486-c, fc2-ppv-1234567
+CODE_PATTERN = re.compile(
+    r"(?P<prefix>fc2[-_\s]?ppv|\d*[a-z]+)[-_\s]*(?P<number>\d+)(?P<suffix>(?:[-_\s]*[a-z0-9]+)*)",
+    re.IGNORECASE,
+)
+
+
+def ensureSearchIndex(conn):
+    """建立全文索引與同步觸發器, 第一次建立時以既有資料重建索引
+
+    SQLite 不支援 FTS5 trigram (3.34 以前) 時回傳 False, 搜尋改用 LIKE.
+    結果依連線記住, 建立失敗後同一連線的搜尋不再重試也不再印出訊息;
+    結構更新仍會前進, 之後換成支援的 SQLite 時由第一次搜尋補建索引.
+    """
+    available = _searchIndex.get(id(conn))
+    if available is not None:
+        return available
+    available = True
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'av_fts'"
+    ).fetchone()
+    if not exists:
+        try:
+            with conn:
+                for statement in FTS_SCHEMA:
+                    conn.execute(statement)
+                conn.execute("INSERT INTO av_fts(av_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            print(f"無法建立全文索引, 改用 LIKE 搜尋: {e}")
+            available = False
+    _searchIndex[id(conn)] = available
+    return available
+
+
+def normalizeFanhao(value):
+    """把番號的各種寫法統一成 (code, variant), 例如 ipx-486-c -> ("IPX-486", "C")
+
+    無法辨識時回傳 None.
+    """
+    match = CODE_PATTERN.fullmatch((value or "").strip().strip("/"))
+    if not match:
+        return None
+    prefix = re.sub(r"[-_\s]", "", match.group("prefix")).upper()
+    if prefix == "FC2PPV":
+        prefix = "FC2-PPV"
+    code = f"{prefix}-{int(match.group('number')):03d}"
+    variant = "-".join(re.findall(r"[a-z0-9]+", match.group("suffix"), re.IGNORECASE)).upper()
+    return code, variant
+
+
+def ensureCodeIndex(conn):
+    """加入正規化番號欄位 (code, variant) 與索引, 並補上尚未計算的資料列"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(av_db)")}
+    with conn:
+        if "code" not in columns:
+            conn.execute("ALTER TABLE av_db ADD COLUMN code TEXT")
+        if "variant" not in columns:
+            conn.execute("ALTER TABLE av_db ADD COLUMN variant TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_av_db_code ON av_db(code, variant)")
+        pending = conn.execute(
+            "SELECT id, fanhao FROM av_db WHERE code IS NULL AND fanhao IS NOT NULL"
+        ).fetchall()
+        updates = [(*codeColumns(fanhao), rowid) for rowid, fanhao in pending]
+        conn.executemany("UPDATE av_db SET code = ?, variant = ? WHERE id = ?", updates)
+    if updates:
+        print(f"已為 {len(updates)} 部影片建立番號索引")
+
+
+def codeColumns(fanhao):
+    """寫入 av_db 時 code, variant 欄位的值; 無法辨識的番號以原字串 (大寫) 作為 code"""
+    code, variant = normalizeFanhao(fanhao) or ((fanhao or "").upper(), "")
+    return code, variant
+
+
+def lookupFanhao(conn, value):
+    """以一次索引查詢找出同一番號的所有版本, 完全相同的版本排在最前面
+
+    回傳 (fanhao, url, title, crawl_date) 列表, 無法辨識的番號回傳空列表.
+    """
+    normalized = normalizeFanhao(value)
+    if normalized is None:
+        return []
+    code, variant = normalized
+    return conn.execute(
+        """
+        SELECT fanhao, url, title, crawl_date FROM av_db
+        WHERE code = ?
+        ORDER BY variant != ?, variant
+        """,
+        (code, variant),
+    ).fetchall()
+
+
+def _createTable(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS av_db (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fanhao TEXT UNIQUE,
+            url TEXT,
+            title TEXT,
+            crawl_date TEXT,
+            crawl_type TEXT,
+            crawl_value TEXT
+        )
+        """
+    )
+    # 舊版資料庫可能缺少後來加入的欄位
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(av_db)")}
+    for column in ("crawl_date", "crawl_type", "crawl_value"):
+        if column not in columns:
+            print(f"添加 {column} 欄位到資料表")
+            conn.execute(f"ALTER TABLE av_db ADD COLUMN {column} TEXT")
+    conn.commit()
+
+
+def _createListIndexes(conn):
+    with conn:
+        # 最新影片列表 ORDER BY crawl_date DESC, id DESC 與依爬取來源查詢
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_av_db_crawl_date ON av_db(crawl_date, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_av_db_crawl ON av_db(crawl_type, crawl_value)")
+
+
+# 依序執行的結構變更, 已執行到第幾個記錄在 PRAGMA user_version; 每一步都可重複執行
+MIGRATIONS = [
+    _createTable,
+    ensureSearchIndex,
+    ensureCodeIndex,
+    _createListIndexes,
+]
+
+
+def migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for step in range(version, len(MIGRATIONS)):
+        MIGRATIONS[step](conn)
+        conn.execute(f"PRAGMA user_version = {step + 1}")
+    if version < len(MIGRATIONS):
+        print(f"資料庫結構已更新到第 {len(MIGRATIONS)} 版")
+
+
+def connect(path=DB_PATH):
+    """回傳本執行緒的資料庫連線, 第一次使用時開啟並套用設定與結構更新
+
+    每個執行緒各自保留一條長期連線 (重複使用已編譯的 SQL), WAL 模式下
+    爬蟲寫入與搜尋可以同時進行, 寫入衝突時等待 DB_BUSY_TIMEOUT 秒而非立即失敗.
+    """
+    connections = _local.__dict__.setdefault("connections", {})
+    conn = connections.get(path)
+    if conn is not None:
+        return conn
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    # 連線只在建立的執行緒使用; 關閉 check_same_thread 是為了結束時能統一關閉
+    conn = sqlite3.connect(
+        path, timeout=DB_BUSY_TIMEOUT, cached_statements=256, check_same_thread=False
+    )
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_MB * 1024}")
+    conn.execute(f"PRAGMA mmap_size = {DB_CACHE_MB * 4 * 1048576}")
+    migrate(conn)
+    connections[path] = conn
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+@atexit.register
+def closeAll():
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.execute("PRAGMA optimize")
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+        _searchIndex.clear()
+
+
+def saveVideos(conn, videos, crawl_type="latest", crawl_value="", crawl_date=None):
+    """在同一個交易中批次寫入一頁影片, 已存在的番號略過
+
+    videos 為 {"f": 番號, "u": 網址, "t": 標題} 列表, 回傳 (新增數, 已存在數).
+    新增數取自 SQLite 回報的實際寫入列數 (不含觸發器), 不需先讀出所有番號.
+    """
+    crawl_date = crawl_date or datetime.date.today().strftime("%Y-%m-%d")
+    rows = [
+        (video["f"], video.get("u"), video.get("t"), crawl_date, crawl_type, crawl_value,
+         *codeColumns(video["f"]))
+        for video in videos
+        if video.get("f")
+    ]
+    with conn:
+        cursor = conn.executemany(
+            """
+            INSERT INTO av_db (fanhao, url, title, crawl_date, crawl_type, crawl_value, code, variant)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(fanhao) DO NOTHING
+            """,
+            rows,
+        )
+    inserted = max(cursor.rowcount, 0)
+    return inserted, len(rows) - inserted
+
+
+def countVideos(conn):
+    return conn.execute("SELECT COUNT(*) FROM av_db").fetchone()[0]
+
+
+# 逐頁讀取時每次向 SQLite 取的筆數
+PAGE_SIZE = 200
+
+
+def _keysetRows(conn, where, params, pageSize=PAGE_SIZE):
+    """依 (crawl_date, id) 由新到舊逐頁讀出符合 where 的影片, 每頁從上一頁最後一筆之後接續
+
+    不用 OFFSET, 每頁都從索引上一頁結束的位置開始讀; crawl_date 為 NULL 的影片排在最後,
+    分開查詢以免 OR 條件讓索引無法定位.
+    """
+    for dated in (True, False):
+        last = None
+        while True:
+            if dated:
+                keyset = "AND crawl_date IS NOT NULL"
+                if last is not None:
+                    keyset += " AND (crawl_date, id) < (?, ?)"
+            else:
+                keyset = "AND crawl_date IS NULL"
+                if last is not None:
+                    keyset += " AND id < ?"
+            keys = () if last is None else (last if dated else last[1:])
+            rows = conn.execute(
+                f"""
+                SELECT id, fanhao, url, title, crawl_date FROM av_db
+                WHERE {where} {keyset}
+                ORDER BY crawl_date DESC, id DESC
+                LIMIT ?
+                """,
+                (*params, *keys, pageSize),
+            ).fetchall()
+            for row in rows:
+                yield row[1:]
+            if len(rows) < pageSize:
+                break
+            last = (rows[-1][4], rows[-1][0])
+
+
+def _fetchRows(cursor, pageSize=PAGE_SIZE):
+    # 一次查詢, 每次只從游標取出 pageSize 筆
+    while True:
+        rows = cursor.fetchmany(pageSize)
+        yield from rows
+        if len(rows) < pageSize:
+            return
+
+
+def _ftsPhrase(conn, keyword):
+    # 關鍵字改用全文索引查詢時回傳 MATCH 片語, 否則回傳 None
+    if len(keyword) >= TRIGRAM_MIN and ensureSearchIndex(conn):
+        return '"' + keyword.replace('"', '""') + '"'
+    return None
+
+
+def _searchFilter(conn, keyword):
+    # 回傳 searchVideos 相同條件的 (WHERE 子句, 參數, 全文索引片語)
+    normalized = normalizeFanhao(keyword)
+    if normalized and conn.execute(
+        "SELECT 1 FROM av_db WHERE code = ? LIMIT 1", (normalized[0],)
+    ).fetchone():
+        return "code = ?", (normalized[0],), None
+    phrase = _ftsPhrase(conn, keyword)
+    if phrase:
+        return "id IN (SELECT rowid FROM av_fts WHERE av_fts MATCH ?)", (phrase,), phrase
+    pattern = _likePattern(keyword)
+    return "(title LIKE ? ESCAPE '\\' OR fanhao LIKE ? ESCAPE '\\')", (pattern, pattern), None
+
+
+def iterLatest(conn, pageSize=PAGE_SIZE):
+    """由新到舊逐筆產生所有影片 (fanhao, url, title, crawl_date)"""
+    return _keysetRows(conn, "1", (), pageSize)
+
+
+def iterSearch(conn, keyword, pageSize=PAGE_SIZE):
+    """逐筆產生符合 keyword 的影片, 依收錄日期由新到舊; 匯出大量結果時使用
+
+    全文索引的比對結果無法從上一頁接續, 逐頁查詢每頁都要重算整個結果集合,
+    因此改為一次 JOIN 查詢再分批讀出; 其他條件沿用逐頁的 keyset 查詢.
+    """
+    where, params, phrase = _searchFilter(conn, keyword)
+    if phrase is None:
+        return _keysetRows(conn, where, params, pageSize)
+    cursor = conn.execute(
+        """
+        SELECT av_db.fanhao, av_db.url, av_db.title, av_db.crawl_date
+        FROM av_fts JOIN av_db ON av_db.id = av_fts.rowid
+        WHERE av_fts MATCH ?
+        ORDER BY av_db.crawl_date DESC, av_db.id DESC
+        """,
+        (phrase,),
+    )
+    return _fetchRows(cursor, pageSize)
+
+
+def iterRanked(conn, keyword, pageSize=PAGE_SIZE):
+    """逐筆產生符合 keyword 的影片, 依相關度排序; 互動瀏覽時使用 (通常只看前幾頁)"""
+    offset = 0
+    while True:
+        rows = searchVideos(conn, keyword, pageSize, offset)
+        yield from rows
+        if len(rows) < pageSize:
+            return
+        offset += pageSize
+
+
+def countSearch(conn, keyword):
+    where, params, _ = _searchFilter(conn, keyword)
+    return conn.execute(f"SELECT COUNT(*) FROM av_db WHERE {where}", params).fetchone()[0]
+
+
+def _likePattern(keyword):
+    escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def searchVideos(conn, keyword, limit=None, offset=0):
+    """搜尋標題或番號包含 keyword 的影片, 回傳 (fanhao, url, title, crawl_date) 列表
+
+    關鍵字是番號時回傳同一番號的所有版本; 否則有全文索引時依 BM25 相關度排序,
+    沒有時依收錄日期由新到舊.
+    limit 為 None 時回傳全部結果.
+    """
+    if normalizeFanhao(keyword):
+        # 關鍵字是番號時先找同一番號的所有版本 (ipx486 / IPX-486 / ipx-486-c)
+        matches = lookupFanhao(conn, keyword)
+        if matches:
+            return matches[offset:] if limit is None else matches[offset : offset + limit]
+    limit = -1 if limit is None else limit
+    phrase = _ftsPhrase(conn, keyword)
+    if phrase:
+        return conn.execute(
+            """
+            SELECT av_db.fanhao, av_db.url, av_db.title, av_db.crawl_date
+            FROM av_fts JOIN av_db ON av_db.id = av_fts.rowid
+            WHERE av_fts MATCH ?
+            ORDER BY bm25(av_fts)
+            LIMIT ? OFFSET ?
+            """,
+            (phrase, limit, offset),
+        ).fetchall()
+    pattern = _likePattern(keyword)
+    return conn.execute(
+        """
+        SELECT fanhao, url, title, crawl_date
+        FROM av_db
+        WHERE title LIKE ? ESCAPE '\\' OR fanhao LIKE ? ESCAPE '\\'
+        ORDER BY crawl_date DESC, id DESC
+        LIMIT ? OFFSET ?
+        """,
+        (pattern, pattern, limit, offset),
+    ).fetchall()
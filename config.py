@@ -1,3 +1,76 @@
+import os
+
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/78.0.3904.97 Safari/537.36',
 }
+
+# 同時下載的片段數 (共用同一個連線池)
+# 啟用 ADAPTIVE 時為起始值, 之後依吞吐量、錯誤率與 429/403 在上下限之間自動調整
+CONCURRENCY = 8
+ADAPTIVE = True
+CONCURRENCY_MIN = 2
+CONCURRENCY_MAX = 64
+
+# 連線池大小 (同一主機保留的 keep-alive 連線數)
+POOL_SIZE = 32
+# 是否啟用 HTTP/2 (需要 h2 套件)
+HTTP2 = False
+# 單一請求逾時秒數
+TIMEOUT = 10
+# 單一片段請求從送出到收完內容的時限 (秒), 避免伺服器慢慢送資料時卡住整部影片; 0 表示不限制
+SEGMENT_TIMEOUT = 120
+
+# 串流合成: 片段解碼後直接依序寫入輸出檔, 不產生子 mp4 也不需要再合成
+STREAM_MERGE = True
+# 重排緩衝區最多可領先寫入位置的片段數
+STREAM_WINDOW = 64
+
+# 分段下載: 伺服器支援 Range 時, 大於 RANGE_MIN_SIZE 的檔案分成 RANGE_PARTS 段並行下載
+RANGE_PARTS = 8
+RANGE_MIN_SIZE = 16 * 1024 * 1024
+# 播放清單的片段數不超過此值時 (少數超大片段), 每個片段也改用分段下載
+RANGE_SEGMENT_COUNT = 16
+
+# 片段解碼: 使用的執行緒數, 設 DECRYPT_PROCESSES = True 改用行程池
+DECRYPT_WORKERS = os.cpu_count() or 4
+DECRYPT_PROCESSES = False
+
+# 片段重試: 每個片段最多嘗試次數, 退避時間 (秒) 由 base 起每次加倍, 最多 max
+RETRY_MAX_ATTEMPTS = 8
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30
+
+# 批次下載: 同時處理的影片數
+BATCH_WORKERS = 3
+# 所有影片合計同時下載的片段數上限
+SEGMENT_BUDGET = 48
+# 每個主機每秒最多發出的片段請求數, 0 表示不限制
+HOST_RATE_LIMIT = 0
+
+# 轉檔時直接把解碼後的片段依序送進 ffmpeg, 下載完成即轉檔完成 (此模式無法中斷後接續)
+PIPE_ENCODE = False
+
+# 背景轉檔: 同時進行的轉檔數量與每個轉檔可用的 CPU 執行緒數
+ENCODE_WORKERS = 1
+ENCODE_THREADS = max(1, (os.cpu_count() or 4) // ENCODE_WORKERS)
+
+# CPU 轉檔時依關鍵影格切成多段, 以 ENCODE_THREADS 個 ffmpeg 同時編碼後無損接回
+ENCODE_CHUNKED = True
+ENCODE_CHUNK_SECONDS = 30
+
+# 轉檔方案測試結果存放位置; 批次模式從中挑選輸出大小不超過原檔 ENCODE_SIZE_TARGET 倍的最快方案
+ENCODE_BENCH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "encode_bench.json")
+ENCODE_BENCH_SECONDS = 60
+ENCODE_SIZE_TARGET = 1.0
+
+# 影片資料庫 (main.py, getList.py, search.py 共用)
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.db")
+DB_BUSY_TIMEOUT = 30  # 其他連線寫入中時最多等待的秒數
+DB_CACHE_MB = 64
+
+# WebDriver 池: 最多同時開啟的 Chrome 數量, 每個 Chrome 借出幾次後重開
+DRIVER_POOL_SIZE = 2
+DRIVER_MAX_PAGES = 50
+DRIVER_PAGE_LOAD_TIMEOUT = 60
+# Chrome 使用的代理 (例如 "http://127.0.0.1:8080"), 留空表示不使用
+DRIVER_PROXY = ""
@@ -1,45 +1,171 @@
 import os
-import requests
-from config import headers
-from functools import partial
-import concurrent.futures
+import asyncio
+from urllib.parse import urlparse
+from config import (
+    CONCURRENCY,
+    CONCURRENCY_MIN,
+    CONCURRENCY_MAX,
+    ADAPTIVE,
+    STREAM_WINDOW,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    RANGE_SEGMENT_COUNT,
+    SEGMENT_TIMEOUT,
+)
+from transport import new_async_client
+from stream import SegmentFiles, OrderedStream, FfmpegPipe
+from throttle import budget, hostLimiter, AdaptiveLimiter
+from retry import RetryPolicy, DownloadError, classify, retryAfter
+from ranged import fetchBytesAsync
+from decrypt import decryptAsync
+from metrics import metrics
 import time
-import copy
 
 
-def scrape(ci, folderPath, downloadList, urls):
-    os.path.split(urls)
-    fileName = urls.split("/")[-1][0:-3]
-    saveName = os.path.join(folderPath, fileName + ".mp4")
-    if os.path.exists(saveName):
-        # 跳過已下載
-        print(
-            "當前目標: {0} 已下載, 故跳過...剩餘 {1} 個".format(
-                urls.split("/")[-1], len(downloadList)
-            )
-        )
-        downloadList.remove(urls)
-    else:
-        response = requests.get(urls, headers=headers, timeout=10)
-        if response.status_code == 200:
-            content_ts = response.content
-            if ci:
-                content_ts = ci.decrypt(content_ts)  # 解碼
-            with open(saveName, "ab") as f:
-                f.write(content_ts)
-                # 輸出進度
-            downloadList.remove(urls)
+async def scrape(client, keys, sink, queue, ready, limiter, policy, progress):
+    # 每個 worker 不斷從佇列取出片段, 失敗的片段依退避時間延後放回佇列
+    while True:
+        index, urls = await queue.get()
+        if sink.ordered and progress["failures"] and index > min(progress["failures"]):
+            # 串流模式下已有片段確定失敗, 其後的片段也無法寫入, 直接放棄
+            queue.task_done()
+            continue
+        if not sink.ready(index):
+            # 重排緩衝區已滿, 放回佇列等待前面的片段寫入或重試片段回到佇列
+            queue.put_nowait((index, urls))
+            queue.task_done()
+            async with ready:
+                await ready.wait()
+            continue
+
+        retryDelay = None
+        try:
+            # 本片的並發上限, 所有影片共用的片段名額與每個主機的請求速率
+            started = await limiter.acquire()
+            status = None
+            size = 0
+            try:
+                ranged = progress["ranged"]
+                if not ranged:
+                    # 分段下載時由 fetchBytesAsync 替每個 Range 請求各自取得
+                    await asyncio.sleep(hostLimiter.reserve(urlparse(urls).netloc))
+                    await budget.acquire()
+                metrics.requestStarted()
+                try:
+                    status, content_ts, headers = await asyncio.wait_for(
+                        fetchSegment(client, urls, ranged), SEGMENT_TIMEOUT or None
+                    )
+                finally:
+                    metrics.requestFinished()
+                    if not ranged:
+                        budget.release()
+                size = len(content_ts)
+            finally:
+                await limiter.release(started, status, size)
+            if status == 200:
+                if keys[index]:
+                    content_ts = await decryptAsync(keys[index], content_ts, progress["timer"])  # 解碼
+                sink.write(index, urls, content_ts)
+                progress["remaining"] -= 1
+                metrics.segmentDone(progress["label"], size, queue.qsize())
+                async with ready:
+                    ready.notify_all()
+                await sink.drain()
+            else:
+                retryDelay = failed(
+                    policy, progress, index, urls, status, None, retryAfter(headers)
+                )
+        except Exception as e:
+            status = type(e).__name__
+            retryDelay = failed(policy, progress, index, urls, None, e, None)
+
+        if retryDelay is None:
+            queue.task_done()
+        else:
+            # 延後重試期間不呼叫 task_done, queue.join() 會等到片段真正完成
+            task = asyncio.create_task(requeue(queue, ready, (index, urls), retryDelay))
+            progress["pending"].add(task)
+            task.add_done_callback(progress["pending"].discard)
+        if progress["failures"]:
+            async with ready:
+                ready.notify_all()
+        # 輸出進度
         print(
-            "\r當前下載: {0} , 剩餘 {1} 個, status code: {2}".format(
-                urls.split("/")[-1], len(downloadList), response.status_code
+            "\r[{0}] 當前下載: {1} , 剩餘 {2} 個, 重試 {3} 次, 並發 {4}, status code: {5}".format(
+                progress["label"],
+                urls.split("/")[-1],
+                progress["remaining"],
+                progress["retries"],
+                limiter.limit,
+                status,
             ),
             end="",
             flush=True,
         )
 
 
-def prepareCrawl(ci, folderPath, tsList):
-    downloadList = copy.deepcopy(tsList)
+async def fetchSegment(client, urls, ranged):
+    # 回傳 (status code, 內容, headers)
+    if ranged:
+        return await fetchBytesAsync(client, urls)
+    response = await client.get(urls)
+    return response.status_code, response.content, response.headers
+
+
+def failed(policy, progress, index, urls, status, error, retryAfter):
+    """記錄一次失敗, 可重試時回傳延後秒數, 否則記入失敗報告並回傳 None"""
+    attempts = progress["attempts"].get(index, 0) + 1
+    progress["attempts"][index] = attempts
+    retryable, reason = classify(status, error)
+    if retryable and attempts < policy.maxAttempts:
+        progress["retries"] += 1
+        metrics.add("retries_total")
+        return policy.delay(attempts, retryAfter)
+    if not retryable:
+        reason += " (不可重試)"
+    progress["failures"][index] = (urls, attempts, reason)
+    metrics.add("failures_total")
+    return None
+
+
+async def requeue(queue, ready, item, delay):
+    await asyncio.sleep(delay)
+    queue.put_nowait(item)
+    queue.task_done()
+    async with ready:
+        ready.notify_all()
+
+
+def printFailures(failures):
+    print("\n片段下載失敗報告 ({0} 個):".format(len(failures)))
+    for index in sorted(failures):
+        urls, attempts, reason = failures[index]
+        print("  #{0} {1}  嘗試 {2} 次  {3}".format(index, urls.split("/")[-1], attempts, reason))
+
+
+def prepareCrawl(
+    keys, folderPath, tsList, outputPath=None, journal=None, codecArgs=None, timer=None
+):
+    # keys[i] 為第 i 個片段的 (key, iv), 未加密為 None
+    # 指定 outputPath 時, 片段解碼後直接依序寫入輸出檔, 不另存子檔
+    # 再指定 codecArgs 時, 改為依序送進 ffmpeg 邊下載邊轉檔
+    if outputPath and codecArgs:
+        sink = FfmpegPipe(outputPath, STREAM_WINDOW, codecArgs)
+    elif outputPath:
+        sink = OrderedStream(outputPath, STREAM_WINDOW, journal)
+    else:
+        sink = SegmentFiles(folderPath, journal)
+    downloadList = []
+    skipped = 0
+    for index, urls in enumerate(tsList):
+        if sink.completed(index, urls):
+            skipped += 1
+        else:
+            downloadList.append((index, urls))
+    if skipped:
+        # 跳過已下載
+        print("已下載 {0} 個片段, 故跳過...".format(skipped))
     # 開始時間
     start_time = time.time()
     print("開始下載 " + str(len(downloadList)) + " 個檔案..", end="")
@@ -50,17 +176,70 @@ def prepareCrawl(ci, folderPath, tsList):
     )
 
     # 開始爬取
-    startCrawl(ci, folderPath, downloadList)
+    try:
+        asyncio.run(
+            startCrawl(keys, sink, downloadList, os.path.basename(folderPath), timer=timer)
+        )
+        sink.close()
+    except BaseException:
+        sink.abort()
+        raise
+    if journal is not None:
+        journal.remove()
 
     end_time = time.time()
     print("\n花費 {0:.2f} 分鐘 爬取完成 !".format((end_time - start_time) / 60))
 
 
-def startCrawl(ci, folderPath, downloadList):
-    # 同時建立及啟用 20 個執行緒
-    round = 0
-    while downloadList != []:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-            executor.map(partial(scrape, ci, folderPath, downloadList), downloadList)
-        round += 1
-        print(f", round {round}")
+async def startCrawl(
+    keys, sink, downloadList, label="", concurrency=CONCURRENCY, timer=None
+):
+    # 所有片段共用一個連線池與一個工作佇列, 依片段順序優先下載
+    # worker 數量取上限, 實際同時進行的請求數由 limiter 控制
+    budget.enter()
+    if ADAPTIVE:
+        # 並發上限隨同時下載的影片數調整為各片分到的共用名額
+        limiter = AdaptiveLimiter(concurrency, CONCURRENCY_MIN, CONCURRENCY_MAX, label, budget)
+        workerCount = min(CONCURRENCY_MAX, budget.size)
+    else:
+        limiter = AdaptiveLimiter(concurrency, concurrency, concurrency, label)
+        workerCount = concurrency
+    queue = asyncio.PriorityQueue()
+    for item in downloadList:
+        queue.put_nowait(item)
+    ready = asyncio.Condition()
+    policy = RetryPolicy(RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+    progress = {
+        "label": label,
+        "remaining": len(downloadList),
+        "retries": 0,
+        "attempts": {},
+        "failures": {},
+        "pending": set(),
+        # 片段很少 (每個都很大) 時, 單一片段也拆成多個 Range 請求並行下載
+        "ranged": 0 < len(downloadList) <= RANGE_SEGMENT_COUNT,
+        "timer": timer,
+    }
+
+    metrics.titleStarted(label, len(downloadList))
+    try:
+        async with new_async_client(workerCount) as client:
+            workers = [
+                asyncio.create_task(
+                    scrape(client, keys, sink, queue, ready, limiter, policy, progress)
+                )
+                for _ in range(min(workerCount, len(downloadList)))
+            ]
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    finally:
+        budget.leave()
+        metrics.titleFinished(label)
+
+    if progress["failures"]:
+        printFailures(progress["failures"])
+        raise DownloadError(
+            "{0} 個片段下載失敗".format(len(progress["failures"]))
+        )
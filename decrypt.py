@@ -0,0 +1,66 @@
+import time
+import asyncio
+import threading
+import concurrent.futures
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+from config import DECRYPT_WORKERS, DECRYPT_PROCESSES
+
+_executor = None
+_lock = threading.Lock()
+
+
+def parseIv(iv):
+    """EXT-X-KEY 的 IV 為 16 進位字串 (0x...)"""
+    iv = iv[2:] if iv.lower().startswith("0x") else iv
+    return bytes.fromhex(iv).rjust(16, b"\0")
+
+
+def sequenceIv(sequence):
+    """沒有指定 IV 時, 以片段的 media sequence 編號 (大端序 128 位元) 作為 IV"""
+    return sequence.to_bytes(16, "big")
+
+
+def decryptSegment(key, iv, data):
+    # 每個片段建立自己的解碼器, 片段之間不共用 CBC 狀態
+    data = AES.new(key, AES.MODE_CBC, iv).decrypt(data)
+    try:
+        return unpad(data, AES.block_size)
+    except ValueError:
+        return data
+
+
+def _timedDecrypt(key, iv, data):
+    # 在解碼池中量測, 不含排隊等待的時間
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    data = decryptSegment(key, iv, data)
+    return data, time.perf_counter() - wall, time.thread_time() - cpu
+
+
+def _getExecutor():
+    # 所有影片共用同一個解碼池; pycryptodome 解碼時會釋放 GIL, 執行緒即可用滿多核
+    global _executor
+    with _lock:
+        if _executor is None:
+            if DECRYPT_PROCESSES:
+                _executor = concurrent.futures.ProcessPoolExecutor(DECRYPT_WORKERS)
+            else:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    DECRYPT_WORKERS, thread_name_prefix="decrypt"
+                )
+    return _executor
+
+
+async def decryptAsync(spec, data, timer=None):
+    """spec 為 (key, iv); 在解碼池中執行, 不阻塞下載的 event loop
+
+    指定 timer 時, 把每個片段的解碼時間累計到 timer 的 decrypt 階段.
+    """
+    key, iv = spec
+    loop = asyncio.get_running_loop()
+    if timer is None:
+        return await loop.run_in_executor(_getExecutor(), decryptSegment, key, iv, data)
+    data, wall, cpu = await loop.run_in_executor(_getExecutor(), _timedDecrypt, key, iv, data)
+    timer.add("decrypt", wall, cpu)
+    return data
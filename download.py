@@ -1,25 +1,79 @@
-import requests
 import os
-import re
-import urllib.request
 import m3u8
-from Crypto.Cipher import AES
-from config import headers
+from urllib.parse import urljoin, urlsplit
+from transport import get_client
+from config import STREAM_MERGE, PIPE_ENCODE
 from crawler import prepareCrawl
+from journal import Journal
+from retry import DownloadError
+from decrypt import parseIv, sequenceIv
 from merge import mergeMp4
 from delete import deleteM3u8, deleteMp4
 from cover import getCover
-from encode import ffmpegEncode
+from page import fetchPage
+from catalog import normalizeFanhao
+from timing import StageTimer, profiled
+from encode import submitEncode, encodeArgs
+from encodebench import selectProfile
 from args import *
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 
 
-def download(url, is_batch=False):
+def fetchKey(keyurl):
+    # 得到 key的內容
+    response = get_client().get(keyurl)
+    contentKey = response.content
+    if response.status_code != 200 or len(contentKey) != 16:
+        # 金鑰錯誤時所有片段都無法解碼, 不值得重試
+        raise DownloadError(
+            f"無法取得有效的金鑰 (status code: {response.status_code}, 長度: {len(contentKey)})"
+        )
+    return contentKey
+
+
+def segmentKeys(m3u8obj, m3u8url):
+    """每個片段各自的 (key, iv), 未加密的片段為 None
+
+    支援播放清單中途更換 EXT-X-KEY; 沒有指定 IV 時依 EXT-X-MEDIA-SEQUENCE 推算.
+    """
+    contentKeys = {}
+    keys = []
+    sequence = m3u8obj.media_sequence or 0
+    for i, seg in enumerate(m3u8obj.segments):
+        key = seg.key
+        if key is None or not key.uri or key.method == "NONE":
+            keys.append(None)
+            continue
+        if key.method != "AES-128":
+            raise DownloadError(f"不支援的加密方式: {key.method}")
+        keyurl = urljoin(m3u8url, key.uri)  # 得到 key 的網址
+        if keyurl not in contentKeys:
+            contentKeys[keyurl] = fetchKey(keyurl)
+        iv = parseIv(key.iv) if key.iv else sequenceIv(sequence + i)
+        keys.append((contentKeys[keyurl], iv))
+    return keys, contentKeys
+
+
+def downloadedPath(base_dir, dirName):
+    """同一番號 (忽略大小寫與寫法差異) 已下載完成時回傳影片路徑, 否則回傳 None"""
+    target = os.path.join(base_dir, dirName, f"{dirName}.mp4")
+    if os.path.exists(target):
+        return target
+    key = normalizeFanhao(dirName)
+    if key is None:
+        return None
+    for name in os.listdir(base_dir):
+        path = os.path.join(base_dir, name, f"{name}.mp4")
+        if normalizeFanhao(name) == key and os.path.exists(path):
+            return path
+    return None
+
+
+def download(url, is_batch=False, profile=False):
+    # 回傳 True 表示已下載完成, False 表示影片已存在而跳過
     encode = 0  # 不轉檔
     if is_batch:
-        print("批次處理模式：自動選擇轉檔方案 1")
-        encode = 1  # 批次模式下，預設使用方案1轉檔
+        encode = selectProfile()  # 批次模式下依本機測試結果選擇, 沒有結果時使用方案1
+        print(f"批次處理模式：自動選擇轉檔方案 {encode}")
     else:
         # 維持原有的詢問邏輯
         action = input("要轉檔嗎?[y/n]")
@@ -51,31 +105,31 @@ def download(url, is_batch=False):
     # 計算絕對目標資料夾路徑
     folderPath = os.path.join(base_download_dir, dirName)
 
-    # 檢查目標影片檔案是否已存在 (使用絕對路徑檢查)
+    # 檢查目標影片檔案是否已存在 (同一番號的其他寫法也算)
     target_mp4_path = os.path.join(folderPath, f"{dirName}.mp4")
-    if os.path.exists(target_mp4_path):
-        print(f"影片檔案 {target_mp4_path} 已存在, 跳過...")
-        return
+    existing = downloadedPath(base_download_dir, dirName)
+    if existing:
+        print(f"影片檔案 {existing} 已存在, 跳過...")
+        return False
 
     # 建立目標資料夾 (如果不存在，使用絕對路徑建立)
     if not os.path.exists(folderPath):
         os.makedirs(folderPath)
     # --- 修正結束 ---
 
-    # 配置Selenium參數
-    options = Options()
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--headless")
-    options.add_argument(
-        "user-agent=Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.125 Safari/537.36"
-    )
-    dr = webdriver.Chrome(options=options)
-    dr.get(url)
-    result = re.search("https://.+m3u8", dr.page_source)
-    print(f"result: {result}")
-    m3u8url = result[0]
+    # 記錄各階段耗時; profile 時另以 cProfile 記錄整個下載流程
+    timer = StageTimer(dirName)
+    profilePath = os.path.join(folderPath, dirName + ".pstats") if profile else None
+    with profiled(profilePath):
+        fetchTitle(url, folderPath, dirName, target_mp4_path, encode, timer)
+
+    return True
+
+
+def fetchTitle(url, folderPath, dirName, target_mp4_path, encode, timer):
+    # 取得頁面與 m3u8 網址 (優先使用 HTTP, 必要時才開瀏覽器)
+    with timer.stage("page"):
+        html, m3u8url = fetchPage(url)
     print(f"m3u8url: {m3u8url}")
 
     # 得到 m3u8 網址
@@ -85,17 +139,13 @@ def download(url, is_batch=False):
 
     # 儲存 m3u8 file 至資料夾
     m3u8file = os.path.join(folderPath, dirName + ".m3u8")
-    urllib.request.urlretrieve(m3u8url, m3u8file)
+    with timer.stage("m3u8"):
+        response = get_client().get(m3u8url)
+        response.raise_for_status()
+        with open(m3u8file, "wb") as f:
+            f.write(response.content)
 
-    # 得到 m3u8 file裡的 URI和 IV
-    m3u8obj = m3u8.load(m3u8file)
-    m3u8uri = ""
-    m3u8iv = ""
-
-    for key in m3u8obj.keys:
-        if key:
-            m3u8uri = key.uri
-            m3u8iv = key.iv
+        m3u8obj = m3u8.load(m3u8file)
 
     # 儲存 ts網址 in tsList
     tsList = []
@@ -103,33 +153,58 @@ def download(url, is_batch=False):
         tsUrl = downloadurl + "/" + seg.uri
         tsList.append(tsUrl)
 
-    # 有加密
-    if m3u8uri:
-        m3u8keyurl = downloadurl + "/" + m3u8uri  # 得到 key 的網址
-        # 得到 key的內容
-        response = requests.get(m3u8keyurl, headers=headers, timeout=10)
-        contentKey = response.content
-
-        vt = m3u8iv.replace("0x", "")[:16].encode()  # IV取前16位
-
-        ci = AES.new(contentKey, AES.MODE_CBC, vt)  # 建構解碼器
-    else:
-        ci = ""
+    # 得到每個片段的 key 和 IV (沒有加密時全部為 None)
+    with timer.stage("keys"):
+        keys, contentKeys = segmentKeys(m3u8obj, m3u8url)
 
     # 刪除m3u8 file
     deleteM3u8(folderPath)
 
-    # 開始爬蟲並下載mp4片段至資料夾
-    prepareCrawl(ci, folderPath, tsList)
-
-    # 合成mp4
-    mergeMp4(folderPath, tsList)
+    # 邊下載邊轉檔: 片段依序送進 ffmpeg, 省去合成後再讀寫一次整個檔案
+    pipeArgs = encodeArgs(encode) if PIPE_ENCODE else None
 
-    # 刪除子mp4
-    deleteMp4(folderPath)
+    if pipeArgs:
+        with timer.stage("download"):
+            prepareCrawl(
+                keys, folderPath, tsList, outputPath=target_mp4_path, codecArgs=pipeArgs, timer=timer
+            )
+        print("下載並轉檔完成!")
+        encode = 0  # 已在下載時轉檔
+    else:
+        # 下載記錄: 中斷後重新執行時, 只補抓缺少或損壞的片段
+        journal = Journal(
+            os.path.join(folderPath, dirName + ".journal"),
+            {
+                # 只比對片段路徑: 簽章網址的 expires/sig 每次取得播放清單都不同
+                "segments": [urlsplit(seg.uri).path for seg in m3u8obj.segments],
+                "keys": sorted(key.hex() for key in contentKeys.values()),
+            },
+        )
+
+        if STREAM_MERGE:
+            # 開始爬蟲並將片段依序直接寫入mp4
+            with timer.stage("download"):
+                prepareCrawl(
+                    keys, folderPath, tsList, outputPath=target_mp4_path, journal=journal, timer=timer
+                )
+            print("下載完成!")
+        else:
+            # 開始爬蟲並下載mp4片段至資料夾
+            with timer.stage("download"):
+                prepareCrawl(keys, folderPath, tsList, journal=journal, timer=timer)
+
+            # 合成mp4
+            with timer.stage("merge"):
+                mergeMp4(folderPath, tsList)
+
+            # 刪除子mp4
+            with timer.stage("delete"):
+                deleteMp4(folderPath)
 
     # 取得封面
-    getCover(html_file=dr.page_source, folder_path=folderPath)
+    with timer.stage("cover"):
+        getCover(html_file=html, folder_path=folderPath)
 
-    # 轉檔
-    ffmpegEncode(folderPath, dirName, encode)
+    # 轉檔 (交給背景轉檔佇列, 不擋住下一部影片的下載), 轉檔完成後才印出耗時
+    if submitEncode(folderPath, dirName, encode, timer) is None:
+        timer.report()
@@ -0,0 +1,139 @@
+import os
+import queue
+import atexit
+import threading
+import contextlib
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import WebDriverException
+from config import (
+    DRIVER_POOL_SIZE,
+    DRIVER_MAX_PAGES,
+    DRIVER_PAGE_LOAD_TIMEOUT,
+    DRIVER_PROXY,
+)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def buildOptions(headless=True):
+    """所有 Selenium 使用者共用的 Chrome 參數"""
+    options = Options()
+    if headless:
+        options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-extensions")
+    # 禁用 Blink 特性中的自動化控制標誌
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option("useAutomationExtension", False)
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument(f"--user-agent={USER_AGENT}")
+    if DRIVER_PROXY:
+        options.add_argument(f"--proxy-server={DRIVER_PROXY}")
+    return options
+
+
+def _service():
+    # 優先使用 INIT.bat 下載到專案目錄的 chromedriver, 否則交給 webdriver-manager
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in ("chromedriver.exe", "chromedriver"):
+        path = os.path.join(script_dir, name)
+        if os.path.exists(path):
+            return Service(path)
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        return Service(ChromeDriverManager().install())
+    except ImportError:
+        return Service()
+
+
+class DriverPool:
+    """保留少量已啟動的 Chrome, 借出時先做健康檢查, 使用 maxPages 次後重開"""
+
+    def __init__(self, size, maxPages, headless=True):
+        self.maxPages = maxPages
+        self.headless = headless
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.uses = {}
+
+    def _create(self):
+        driver = webdriver.Chrome(service=_service(), options=buildOptions(self.headless))
+        driver.set_page_load_timeout(DRIVER_PAGE_LOAD_TIMEOUT)
+        self.uses[id(driver)] = 0
+        return driver
+
+    def _healthy(self, driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _quit(self, driver):
+        self.uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"關閉 WebDriver 時發生錯誤: {e}")
+
+    def _take(self):
+        while True:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                return self._create()
+            if self._healthy(driver):
+                return driver
+            self._quit(driver)
+
+    @contextlib.contextmanager
+    def checkout(self):
+        self.slots.acquire()
+        driver = None
+        broken = False
+        try:
+            driver = self._take()
+            yield driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            if driver is not None:
+                self.uses[id(driver)] = self.uses.get(id(driver), 0) + 1
+                if broken or self.uses[id(driver)] >= self.maxPages:
+                    self._quit(driver)
+                else:
+                    self.idle.put(driver)
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._quit(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def checkout(headless=True):
+    """借出一個 WebDriver: with checkout() as driver: ..."""
+    with _pools_lock:
+        if headless not in _pools:
+            _pools[headless] = DriverPool(DRIVER_POOL_SIZE, DRIVER_MAX_PAGES, headless)
+        pool = _pools[headless]
+    return pool.checkout()
+
+
+@atexit.register
+def closeAll():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
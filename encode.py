@@ -1,41 +1,170 @@
 import os
+import glob
+import shutil
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+from config import ENCODE_WORKERS, ENCODE_THREADS, ENCODE_CHUNKED, ENCODE_CHUNK_SECONDS
+
+# 各轉檔方案的 ffmpeg 編碼參數
+ENCODE_PROFILES = {
+    1: ['-c', 'copy', '-bsf:a', 'aac_adtstoasc', '-movflags', '+faststart'],  #快速無損轉檔
+    2: ['-c:v', 'h264_nvenc', '-b:v', '10000K', '-threads', str(ENCODE_THREADS)],  #GPU轉檔
+    3: ['-c:v', 'libx264', '-b:v', '3M', '-threads', str(ENCODE_THREADS), '-preset', 'superfast'],  #CPU轉檔
+}
+
+
+# 可切段平行編碼的方案 (純 CPU 編碼, 每段互不相依)
+CHUNKED_PROFILES = {3}
+
+
+def encodeArgs(action):
+    return ENCODE_PROFILES.get(action)
+
+
+def withThreads(args, threads):
+    # 把參數中的 -threads 換成指定數量
+    args = list(args)
+    if '-threads' in args:
+        args[args.index('-threads') + 1] = str(threads)
+    return args
+
+
+def chunkedEncode(folder_path, file_name, args, jobs=ENCODE_THREADS, seconds=ENCODE_CHUNK_SECONDS):
+    """依關鍵影格把影像切成多段, 以多個 ffmpeg 行程同時編碼後再無損接回並加上原音軌
+
+    切出的段數不足兩段時回傳 False, 由呼叫端改用一般轉檔.
+    """
+    source = f'{file_name}.mp4'
+    chunkDir = os.path.join(folder_path, f'.chunks_{file_name}')
+    shutil.rmtree(chunkDir, ignore_errors=True)
+    os.makedirs(chunkDir)
+    try:
+        # segment muxer 只在關鍵影格切開, 以 copy 切段不需重新編碼
+        subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error', '-i', source,
+                               '-map', '0:v:0', '-c', 'copy', '-f', 'segment',
+                               '-segment_time', str(seconds), '-reset_timestamps', '1',
+                               os.path.join(chunkDir, 'src_%05d.ts')], cwd=folder_path)
+        chunks = sorted(glob.glob(os.path.join(chunkDir, 'src_*.ts')))
+        if len(chunks) < 2:
+            return False
+        workers = min(jobs, len(chunks))
+        print(f"\n{file_name} 切成 {len(chunks)} 段, 以 {workers} 個 ffmpeg 同時編碼")
+
+        # 每段一個 ffmpeg 行程, 總執行緒數維持在 jobs 以內
+        chunkArgs = withThreads(args, max(1, jobs // len(chunks)))
+
+        def encodeChunk(chunk):
+            output = chunk.replace('src_', 'enc_')
+            subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error', '-i', chunk,
+                                   *chunkArgs, '-an', output])
+            return output
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(encodeChunk, chunks))
+
+        listPath = os.path.join(chunkDir, 'list.txt')
+        with open(listPath, 'w', encoding='utf-8') as f:
+            for output in outputs:
+                f.write("file '{0}'\n".format(os.path.basename(output)))
+        # 編好的影像段直接接回, 音軌取自原檔
+        subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error',
+                               '-f', 'concat', '-safe', '0', '-i', listPath, '-i', source,
+                               '-map', '0:v:0', '-map', '1:a?', '-c:v', 'copy', '-c:a', 'aac',
+                               '-movflags', '+faststart', f'f_{file_name}.mp4'], cwd=folder_path)
+        return True
+    finally:
+        shutil.rmtree(chunkDir, ignore_errors=True)
+
+
 def ffmpegEncode(folder_path, file_name, action):
-    if action == 0: #不轉檔
-        return
-    elif action == 1: #快速無損轉檔
-        os.chdir(folder_path)
-        try:
-            subprocess.call(['ffmpeg', '-i', f'{file_name}.mp4',
-                             '-c', 'copy', '-bsf:a', 'aac_adtstoasc', '-movflags', '+faststart',
-                             f'f_{file_name}.mp4'])
-            os.remove(os.path.join(folder_path, f'{file_name}.mp4'))
-            os.rename(os.path.join(folder_path, f'f_{file_name}.mp4'), os.path.join(folder_path, f'{file_name}.mp4'))
-            print("轉檔成功!")
-
-        except:
-            print("轉檔失敗!")
-    elif action == 2: #GPU轉檔
-        os.chdir(folder_path)
-        try:
-            subprocess.call(['ffmpeg', '-i', f'{file_name}.mp4','-c:v', 'h264_nvenc', '-b:v', '10000K',
-                                '-threads', '5', f'f_{file_name}.mp4'])
-            os.remove(os.path.join(folder_path, f'{file_name}.mp4'))
-            os.rename(os.path.join(folder_path, f'f_{file_name}.mp4'), os.path.join(folder_path, f'{file_name}.mp4'))
-            print("轉檔成功!")
-
-        except:
-            print("轉檔失敗!")
-    elif action == 3: #CPU轉檔
-        os.chdir(folder_path)
+    # 回傳是否轉檔成功, 不轉檔時回傳 None
+    args = encodeArgs(action)
+    if args is None: #不轉檔
+        return None
+    try:
+        if not (ENCODE_CHUNKED and action in CHUNKED_PROFILES
+                and chunkedEncode(folder_path, file_name, args)):
+            subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error', '-i', f'{file_name}.mp4', *args,
+                                   f'f_{file_name}.mp4'], cwd=folder_path)
+        os.replace(os.path.join(folder_path, f'f_{file_name}.mp4'), os.path.join(folder_path, f'{file_name}.mp4'))
+        print(f"\n{file_name} 轉檔成功!")
+        return True
+
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"\n{file_name} 轉檔失敗! {e}")
         try:
-            subprocess.call(['ffmpeg', '-i', f'{file_name}.mp4', '-c:v', 'libx264', '-b:v', '3M',
-                            '-threads', '5', '-preset', 'superfast', f'f_{file_name}.mp4'])
-            os.remove(os.path.join(folder_path, f'{file_name}.mp4'))
-            os.rename(os.path.join(folder_path, f'f_{file_name}.mp4'), os.path.join(folder_path, f'{file_name}.mp4'))
-            print("轉檔成功!")
-
-        except:
-            print("轉檔失敗!")
-    else:
-        return
+            os.remove(os.path.join(folder_path, f'f_{file_name}.mp4'))  # 保留原檔, 刪除未完成的輸出
+        except OSError:
+            pass
+        return False
+
+
+def encodeJob(folder_path, file_name, action, timer=None):
+    # 指定 timer 時記錄轉檔階段, 完成後印出整部影片的各階段耗時
+    ok = None
+    try:
+        if timer is None:
+            ok = ffmpegEncode(folder_path, file_name, action)
+        else:
+            with timer.stage("encode"):
+                ok = ffmpegEncode(folder_path, file_name, action)
+            timer.report()
+    finally:
+        metrics.encodeFinished(ok)
+    return ok
+
+
+class EncodePool:
+    """背景轉檔佇列
+
+    轉檔交給獨立的工作執行緒以子行程執行, 下載迴圈不必等待就能開始下一部影片.
+    同時轉檔數量由 workers 限制, 每個轉檔的執行緒數由 ENCODE_THREADS 限制.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = None
+        self.jobs = []
+        self.lock = threading.Lock()
+
+    def submit(self, folder_path, file_name, action, timer=None):
+        if encodeArgs(action) is None:
+            return None
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="encode"
+                )
+            metrics.encodeQueued()
+            future = self.executor.submit(encodeJob, folder_path, file_name, action, timer)
+            self.jobs.append((file_name, future))
+            waiting = len([job for job in self.jobs if not job[1].done()])
+        print(f"已加入轉檔佇列: {file_name} (等待中 {waiting} 個)")
+        return future
+
+    def wait(self):
+        # 等待所有已送出的轉檔完成, 回傳失敗的檔名
+        with self.lock:
+            jobs, self.jobs = self.jobs, []
+        if not jobs:
+            return []
+        if any(not future.done() for _, future in jobs):
+            print(f"\n等待背景轉檔完成 ({len(jobs)} 個)...")
+        failed = [name for name, future in jobs if future.result() is False]
+        print(f"轉檔結束: 成功 {len(jobs) - len(failed)} 個, 失敗 {len(failed)} 個")
+        for name in failed:
+            print(f"  轉檔失敗: {name}")
+        return failed
+
+
+encoder = EncodePool(ENCODE_WORKERS)
+
+
+def submitEncode(folder_path, file_name, action, timer=None):
+    return encoder.submit(folder_path, file_name, action, timer)
+
+
+def waitEncodes():
+    return encoder.wait()
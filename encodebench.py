@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+from config import ENCODE_BENCH_PATH, ENCODE_BENCH_SECONDS, ENCODE_SIZE_TARGET
+from encode import ENCODE_PROFILES, ffmpegEncode
+
+DEFAULT_PROFILE = 1
+
+
+def hostId():
+    # 不同機器的測試結果不通用
+    return f"{platform.node()}/{os.cpu_count()}"
+
+
+def makeClip(path, seconds):
+    # 以 lavfi 測試訊號產生接近來源影片的 720p H.264 + AAC 的 MPEG-TS
+    subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error',
+                           '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+                           '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                           '-c:v', 'libx264', '-b:v', '4M', '-preset', 'veryfast',
+                           '-c:a', 'aac', '-f', 'mpegts', path])
+
+
+def benchmarkProfiles(seconds=ENCODE_BENCH_SECONDS, path=ENCODE_BENCH_PATH):
+    """在本機實測每個轉檔方案的速度與輸出大小, 存檔並回傳結果"""
+    workDir = tempfile.mkdtemp(prefix="encode_bench_")
+    try:
+        clip = os.path.join(workDir, "clip.ts")
+        print(f"產生 {seconds} 秒測試影片...")
+        makeClip(clip, seconds)
+        clipSize = os.path.getsize(clip)
+        profiles = {}
+        for action in sorted(ENCODE_PROFILES):
+            folder = os.path.join(workDir, str(action))
+            os.makedirs(folder)
+            shutil.copyfile(clip, os.path.join(folder, "bench.mp4"))
+            print(f"測試轉檔方案 {action}...")
+            start = time.perf_counter()
+            ok = ffmpegEncode(folder, "bench", action)
+            elapsed = time.perf_counter() - start
+            result = {"ok": bool(ok), "seconds": round(elapsed, 3)}
+            if ok:
+                size = os.path.getsize(os.path.join(folder, "bench.mp4"))
+                result["speed"] = round(seconds / elapsed, 2)  # 幾倍於即時
+                result["size_ratio"] = round(size / clipSize, 3)
+            profiles[str(action)] = result
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    results = {"host": hostId(), "time": time.time(), "clip_seconds": seconds, "profiles": profiles}
+    results["selected"] = pickProfile(results)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    printResults(results)
+    return results
+
+
+def pickProfile(results, sizeTarget=ENCODE_SIZE_TARGET):
+    # 輸出大小符合目標的方案中取最快者, 沒有符合者時使用預設方案
+    candidates = [
+        (result["speed"], int(action))
+        for action, result in results["profiles"].items()
+        if result["ok"] and result["size_ratio"] <= sizeTarget
+    ]
+    return max(candidates)[1] if candidates else DEFAULT_PROFILE
+
+
+def selectProfile(path=ENCODE_BENCH_PATH):
+    """批次模式使用的轉檔方案: 本機有測試結果時依結果挑選, 否則使用方案 1"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        return DEFAULT_PROFILE
+    if results.get("host") != hostId():
+        return DEFAULT_PROFILE
+    return pickProfile(results)
+
+
+def printResults(results):
+    print("\n方案  狀態  耗時(秒)  速度(倍即時)  大小比例")
+    for action, result in sorted(results["profiles"].items()):
+        if result["ok"]:
+            print(f"{action:>4}  成功  {result['seconds']:8.2f}  {result['speed']:12.2f}  {result['size_ratio']:8.3f}")
+        else:
+            print(f"{action:>4}  失敗  {result['seconds']:8.2f}")
+    print(f"大小目標 {ENCODE_SIZE_TARGET} 倍以內, 批次模式將使用方案 {results['selected']}")
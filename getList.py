@@ -6,10 +6,11 @@ import os
 import re
 import sqlite3
 import sys
-import datetime
 import json
 from urllib.parse import urlparse
 from bs4 import BeautifulSoup
+from catalog import connect, searchVideos, saveVideos, countVideos
+from config import DB_PATH
 
 # Selenium 相關導入
 from selenium import webdriver
@@ -17,9 +18,6 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
-# 資料庫設定
-DB_PATH = "D:\\jable\\spider_for_jable.tv\\test.db"
-
 # URL 模板
 URL_TEMPLATES = {
     "latest": "https://jable.tv/latest-updates/?mode=async&function=get_block&block_id=list_videos_latest_videos_list&sort_by=post_date&from=",
@@ -44,96 +42,17 @@ COMMON_OPTIONS = {
 
 # --- 資料庫相關函數 ---
 def setup_database():
-    """設置資料庫，如果不存在則創建"""
-    # 檢查資料庫目錄是否存在，如果不存在則創建
-    db_dir = os.path.dirname(DB_PATH)
-    if not os.path.exists(db_dir):
-        os.makedirs(db_dir)
-        print(f"已創建目錄: {db_dir}")
-
-    # 連接資料庫（如果不存在會自動創建）
-    conn = sqlite3.connect(DB_PATH)
+    """取得資料庫連線 (不存在時建立並更新結構)"""
+    # 連線由 catalog 管理, 同一執行緒重複使用
+    conn = connect()
     print(f"已連接到資料庫: {DB_PATH}")
+    return conn, conn.cursor()
 
-    # 啟用外鍵約束
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
-
-    # 創建資料表（如果不存在）
-    cursor.execute(
-        """
-    CREATE TABLE IF NOT EXISTS av_db (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        fanhao TEXT UNIQUE,
-        url TEXT,
-        title TEXT,
-        crawl_date TEXT,
-        crawl_type TEXT,
-        crawl_value TEXT
-    )
-    """
-    )
-
-    conn.commit()
-    return conn, cursor
-
-
-def check_db_structure(conn, cursor):
-    """檢查資料庫結構"""
-    cursor.execute("PRAGMA table_info(av_db)")
-    columns = cursor.fetchall()
-    print("資料表結構:")
-    for column in columns:
-        print(column)
-
-    # 檢查是否需要添加 crawl_date 欄位
-    column_names = [column[1] for column in columns]
-    if "crawl_date" not in column_names:
-        print("添加 crawl_date 欄位到資料表")
-        cursor.execute("ALTER TABLE av_db ADD COLUMN crawl_date TEXT")
-        conn.commit()
 
-    # 檢查是否需要添加 crawl_type 欄位
-    if "crawl_type" not in column_names:
-        print("添加 crawl_type 欄位到資料表")
-        cursor.execute("ALTER TABLE av_db ADD COLUMN crawl_type TEXT")
-        conn.commit()
-
-    # 檢查是否需要添加 crawl_value 欄位
-    if "crawl_value" not in column_names:
-        print("添加 crawl_value 欄位到資料表")
-        cursor.execute("ALTER TABLE av_db ADD COLUMN crawl_value TEXT")
-        conn.commit()
-
-
-def search_videos_in_python(keyword):
-    """在 Python 中進行過濾搜尋"""
+def search_videos_in_python(keyword, limit=None, offset=0):
+    """以全文索引搜尋標題或番號 (依相關度排序)"""
     try:
-        # 連接資料庫
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # 獲取所有記錄
-        cursor.execute("SELECT fanhao, url, title, crawl_date FROM av_db")
-        all_records = cursor.fetchall()
-
-        # 關閉資料庫連接
-        cursor.close()
-        conn.close()
-
-        # 在 Python 中進行過濾
-        keyword_lower = keyword.lower()  # 轉為小寫以進行不區分大小寫的搜尋
-        results = []
-
-        for record in all_records:
-            fanhao, url, title, crawl_date = record
-            # 檢查標題或番號是否包含關鍵字
-            if (title and keyword_lower in title.lower()) or (
-                fanhao and keyword_lower in fanhao.lower()
-            ):
-                results.append((fanhao, url, title, crawl_date))
-
-        return results
+        return searchVideos(connect(), keyword, limit, offset)
     except Exception as e:
         print(f"搜尋時發生錯誤: {e}")
         return []
@@ -142,27 +61,16 @@ def search_videos_in_python(keyword):
 def get_latest_videos(limit=20):
     """獲取最新的影片（按照收錄日期排序）"""
     try:
-        # 連接資料庫
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
         # 獲取最新的記錄
-        cursor.execute(
+        return connect().execute(
             """
-            SELECT fanhao, url, title, crawl_date 
-            FROM av_db 
-            ORDER BY crawl_date DESC, id DESC 
+            SELECT fanhao, url, title, crawl_date
+            FROM av_db
+            ORDER BY crawl_date DESC, id DESC
             LIMIT ?
         """,
             (limit,),
-        )
-        latest_records = cursor.fetchall()
-
-        # 關閉資料庫連接
-        cursor.close()
-        conn.close()
-
-        return latest_records
+        ).fetchall()
     except Exception as e:
         print(f"獲取最新影片時發生錯誤: {e}")
         return []
@@ -346,47 +254,17 @@ def parse_videos(html_content):
     return videos
 
 
-def get_existing_fanhaos(cursor):
-    """獲取資料庫中已存在的所有番號"""
-    cursor.execute("SELECT fanhao FROM av_db")
-    return {row[0] for row in cursor.fetchall()}
-
-
-def save_to_database(
-    conn, cursor, videos, existing_fanhaos, crawl_type="latest", crawl_value=""
-):
-    """保存視頻到資料庫，跳過已存在的番號，並返回是否發現已存在的影片"""
-    found_existing = False
-    new_videos_count = 0
-
-    # 獲取當前日期，格式為 YYYY-MM-DD
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-
-    for video in videos:
-        fanhao = video["f"]
-        if not fanhao or fanhao in existing_fanhaos:
-            print(f"跳過已存在的番號: {fanhao}")
-            found_existing = True
-            continue
-
-        try:
-            cursor.execute(
-                "INSERT INTO av_db (fanhao, url, title, crawl_date, crawl_type, crawl_value) VALUES (?, ?, ?, ?, ?, ?)",
-                (fanhao, video["u"], video["t"], current_date, crawl_type, crawl_value),
-            )
-            existing_fanhaos.add(fanhao)  # 更新已存在番號集合
-            new_videos_count += 1
-            print(f"已保存: {fanhao} - {video['t']} - 爬取日期: {current_date}")
-        except sqlite3.IntegrityError:
-            # 處理唯一性約束衝突
-            print(f"番號已存在 (衝突): {fanhao}")
-            found_existing = True
-        except Exception as e:
-            print(f"保存視頻時出錯: {e}")
+def save_to_database(conn, videos, crawl_type="latest", crawl_value=""):
+    """批次保存一頁視頻到資料庫，跳過已存在的番號，並返回是否發現已存在的影片"""
+    try:
+        # 同一個交易寫入整頁, 新增與已存在的數量由 SQLite 回報
+        new_videos_count, existing_count = saveVideos(conn, videos, crawl_type, crawl_value)
+    except sqlite3.Error as e:
+        print(f"保存視頻時出錯: {e}")
+        return False
 
-    conn.commit()
-    print(f"本頁新增了 {new_videos_count} 個新影片")
-    return found_existing
+    print(f"本頁新增了 {new_videos_count} 個新影片, {existing_count} 個已存在")
+    return existing_count > 0
 
 
 def crawl_videos_by_type():
@@ -395,12 +273,8 @@ def crawl_videos_by_type():
         # 設置資料庫
         conn, cursor = setup_database()
 
-        # 檢查資料表結構
-        check_db_structure(conn, cursor)
-
-        # 獲取已存在的番號
-        existing_fanhaos = get_existing_fanhaos(cursor)
-        print(f"資料庫中已有 {len(existing_fanhaos)} 個影片")
+        # 已收錄的影片數量
+        print(f"資料庫中已有 {countVideos(conn)} 個影片")
 
         # 選擇爬取類型
         print("\n請選擇爬取類型:")
@@ -414,7 +288,6 @@ def crawl_videos_by_type():
 
         if crawl_type_choice == "0":
             cursor.close()
-            conn.close()
             return
 
         # 根據選擇設置爬取參數
@@ -467,7 +340,6 @@ def crawl_videos_by_type():
         else:
             print("無效的選擇，返回主選單")
             cursor.close()
-            conn.close()
             return
 
         # 獲取爬取頁數
@@ -480,7 +352,6 @@ def crawl_videos_by_type():
                 max_pages = int(pages_input)
                 if max_pages == 0:
                     cursor.close()
-                    conn.close()
                     return
                 elif max_pages > 0:
                     break
@@ -491,7 +362,6 @@ def crawl_videos_by_type():
             except EOFError:
                 print("\n檢測到輸入終止符。返回主選單。")
                 cursor.close()
-                conn.close()
                 return
 
         # 設置 Selenium
@@ -511,9 +381,7 @@ def crawl_videos_by_type():
                         # 保存視頻到資料庫，並檢查是否發現已存在的影片
                         found_existing = save_to_database(
                             conn,
-                            cursor,
                             videos,
-                            existing_fanhaos,
                             crawl_type,
                             crawl_value,
                         )
@@ -578,11 +446,9 @@ def crawl_videos_by_type():
     except Exception as e:
         print(f"程式執行時發生錯誤: {e}")
     finally:
-        # 確保關閉資料庫連接
-        if "conn" in locals() and conn:
+        # 資料庫連線由 catalog 保留重複使用, 程式結束時統一關閉
+        if "cursor" in locals() and cursor:
             cursor.close()
-            conn.close()
-            print("資料庫連接已關閉")
 
         print("爬蟲執行完畢")
 
@@ -614,15 +480,10 @@ def search_videos():
         export_to_file(keyword, results)
     else:
         # 顯示一些標題樣本，幫助確認關鍵字是否正確
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT title FROM av_db LIMIT 10")
-        sample_titles = cursor.fetchall()
+        sample_titles = connect().execute("SELECT title FROM av_db LIMIT 10").fetchall()
         print("\n資料庫中的一些標題樣本:")
         for title in sample_titles:
             print(f"- {title[0]}")
-        cursor.close()
-        conn.close()
 
 
 def list_latest_videos():
@@ -1,4 +1,4 @@
-import requests
+from transport import get_client
 from bs4 import BeautifulSoup
 import zipfile
 import shutil
@@ -6,7 +6,7 @@ import os
 
 def get_chromedriver_version():
     url = 'https://googlechromelabs.github.io/chrome-for-testing/'
-    response = requests.get(url)
+    response = get_client().get(url)
 
     if response.status_code == 200:
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -26,7 +26,7 @@ def get_chromedriver_version():
 
 def download_chromedriver(download_link):
     url = download_link
-    response = requests.get(url)
+    response = get_client().get(url)
 
     if response.status_code == 200:
         with open('chromedriver.zip', 'wb') as file:
@@ -0,0 +1,260 @@
+import re
+import sys
+import hmac
+import time
+import random
+import socket
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+from decrypt import sequenceIv
+
+
+class SyntheticTitle:
+    """合成的 AES-128 加密 HLS 影片, 內容以 seed 決定, 可重現
+
+    payload 為各片段的明文; 未指定時產生 segments 個 size 位元組的隨機內容.
+    IV 依 EXT-X-MEDIA-SEQUENCE 推算, 與真實播放清單常見的寫法相同.
+    """
+
+    def __init__(self, name, segments=100, size=512 * 1024, seed=0, payload=None, duration=4):
+        rng = random.Random(seed)
+        self.name = name
+        self.duration = duration
+        self.sequence = rng.randrange(1000)
+        self.key = rng.randbytes(16)
+        if payload is None:
+            payload = [rng.randbytes(size) for _ in range(segments)]
+        self.segments = [
+            AES.new(self.key, AES.MODE_CBC, sequenceIv(self.sequence + i)).encrypt(pad(data, 16))
+            for i, data in enumerate(payload)
+        ]
+        self.size = sum(len(data) for data in payload)
+        self.digest = hashlib.sha256(b"".join(payload)).hexdigest()  # 合成後的檔案應有的雜湊
+
+    def playlist(self, sign=None):
+        # sign(檔名) 回傳附加在片段網址後的簽章參數, 模擬會過期的 CDN 網址
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{self.duration}",
+            f"#EXT-X-MEDIA-SEQUENCE:{self.sequence}",
+            '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"',
+        ]
+        for i in range(len(self.segments)):
+            lines.append(f"#EXTINF:{self.duration}.000,")
+            name = f"seg_{i:05d}.ts"
+            lines.append(name + (sign(name) if sign else ""))
+        lines.append("#EXT-X-ENDLIST")
+        return ("\n".join(lines) + "\n").encode()
+
+    def resource(self, path, sign=None):
+        """回傳檔名對應的內容, 不存在時回傳 None"""
+        if path == "index.m3u8":
+            return self.playlist(sign)
+        if path == "key.bin":
+            return self.key
+        match = re.fullmatch(r"seg_(\d+)\.ts", path)
+        if match and int(match.group(1)) < len(self.segments):
+            return self.segments[int(match.group(1))]
+        return None
+
+
+class Faults:
+    """對片段請求注入的錯誤, 各機率為每個請求發生的機率
+
+    delay: 回應前額外等待 delaySeconds 秒
+    slow: 以 slowSeconds 秒慢慢送完內容 (slow loris)
+    drop: 不回應直接關閉連線
+    truncate: 宣告完整長度但只送出一半內容就關閉連線
+    status: {狀態碼: 機率}, 429 與 503 會附上 Retry-After
+    ttl: 片段網址附上簽章, 播放清單取得 ttl 秒後過期並回應 403
+    """
+
+    def __init__(self, delay=0, delaySeconds=1.0, slow=0, slowSeconds=5.0, drop=0, truncate=0,
+                 status=None, retryAfter=1, ttl=None, seed=0):
+        self.delay = delay
+        self.delaySeconds = delaySeconds
+        self.slow = slow
+        self.slowSeconds = slowSeconds
+        self.drop = drop
+        self.truncate = truncate
+        self.status = status or {}
+        self.retryAfter = retryAfter
+        self.ttl = ttl
+        self.secret = random.Random(seed).randbytes(16)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.injected = {}  # 錯誤種類 -> 次數
+
+    def pick(self):
+        """抽出這次請求要注入的錯誤, 回傳種類 (或狀態碼), 沒有時回傳 None"""
+        kinds = [("delay", self.delay), ("slow", self.slow), ("drop", self.drop),
+                 ("truncate", self.truncate), *self.status.items()]
+        with self.lock:
+            roll = self.rng.random()
+            for kind, chance in kinds:
+                if roll < chance:
+                    self.injected[kind] = self.injected.get(kind, 0) + 1
+                    return kind
+                roll -= chance
+        return None
+
+    def _signature(self, name, expires):
+        return hmac.new(self.secret, f"{name}:{expires}".encode(), hashlib.sha256).hexdigest()[:16]
+
+    def sign(self, name):
+        expires = int(time.time() + self.ttl)
+        return f"?expires={expires}&sig={self._signature(name, expires)}"
+
+    def verify(self, name, query):
+        params = dict(item.split("=", 1) for item in query.split("&") if "=" in item)
+        try:
+            expires = int(params.get("expires", ""))
+        except ValueError:
+            return False
+        if not hmac.compare_digest(params.get("sig", ""), self._signature(name, expires)):
+            return False
+        if expires < time.time():
+            with self.lock:
+                self.injected["expired"] = self.injected.get("expired", 0) + 1
+            return False
+        return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支援 keep-alive, 與真實 CDN 一樣重用連線
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def respond(self, head):
+        server = self.server
+        server.count()
+        path, _, query = self.path.partition("?")
+        parts = path.strip("/").split("/", 1)
+        faults = server.faults
+        sign = faults.sign if faults and faults.ttl else None
+        title = server.titles.get(parts[0])
+        body = title.resource(parts[1], sign) if title and len(parts) == 2 else None
+        if server.latency:
+            time.sleep(server.latency)
+        if body is None:
+            self.send_error(404)
+            return
+
+        fault = None
+        if faults and parts[1].startswith("seg_"):
+            if sign and not faults.verify(parts[1], query):
+                self.send_error(403, "URL expired")
+                return
+            fault = faults.pick()
+            if fault == "delay":
+                time.sleep(faults.delaySeconds)
+            elif fault == "drop":
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            elif isinstance(fault, int):
+                self.send_response(fault)
+                if fault in (429, 503):
+                    self.send_header("Retry-After", str(faults.retryAfter))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        status = 200
+        headers = {"Accept-Ranges": "bytes"}
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or len(body) - 1), len(body) - 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body = body[start : end + 1]
+            status = 206
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if head:
+            return
+        if fault == "truncate":
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+        elif fault == "slow":
+            self.send(body, len(body) / faults.slowSeconds)
+        else:
+            self.send(body)
+
+    def send(self, body, rate=None):
+        # bandwidth 為每個連線的每秒位元組數, 0 表示不限制
+        rate = rate or self.server.bandwidth
+        if not rate:
+            self.wfile.write(body)
+            return
+        chunk = max(1, int(rate / 20))
+        started = time.monotonic()
+        for offset in range(0, len(body), chunk):
+            self.wfile.write(body[offset : offset + chunk])
+            wait = started + (offset + chunk) / rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HlsServer(ThreadingHTTPServer):
+    """在本機背景執行緒提供合成 HLS 影片的 HTTP 伺服器
+
+    latency 為每個請求回應前的延遲秒數, bandwidth 為每個連線的每秒位元組數,
+    faults 為 Faults, 對片段請求注入錯誤.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, titles, latency=0, bandwidth=0, faults=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.titles = {title.name: title for title in titles}
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.faults = faults
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def handle_error(self, request, client_address):
+        # 客戶端逾時放棄或注入的斷線都會中斷連線, 不需要印出 traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+    def url(self, name):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/{name}/index.m3u8"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="hlsserver", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
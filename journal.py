@@ -0,0 +1,68 @@
+import os
+import json
+import hashlib
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class Journal:
+    """每部影片的下載記錄, 存成資料夾內的 <番號>.journal (JSON lines)
+
+    第一行記錄播放清單的片段路徑 (不含查詢參數) 與金鑰, 之後每完成一個片段追加一行
+    {"index", "size", "sha256"}. 重新啟動時若播放清單相同就沿用舊記錄,
+    否則整份作廢重新下載.
+    """
+
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        self.entries = {}
+        if os.path.exists(path):
+            self._load()
+        # 重寫一次乾淨的記錄, 去掉上次中斷時寫到一半的最後一行
+        self.file = open(path, "w", encoding="utf-8")
+        self._append(header)
+        for index in sorted(self.entries):
+            self._append(self.entries[index])
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return
+        if header != self.header:
+            print("播放清單已變更, 捨棄舊的下載記錄")
+            return
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            self.entries[entry["index"]] = entry
+        print("找到下載記錄, 已完成 {0} 個片段".format(len(self.entries)))
+
+    def _append(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def record(self, index, data):
+        entry = {"index": index, "size": len(data), "sha256": digest(data)}
+        self.entries[index] = entry
+        self._append(entry)
+        self.file.flush()
+
+    def verify(self, index, data):
+        entry = self.entries.get(index)
+        return (
+            entry is not None
+            and entry["size"] == len(data)
+            and entry["sha256"] == digest(data)
+        )
+
+    def remove(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
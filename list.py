@@ -6,15 +6,13 @@ import time  # 用於時間延遲
 import os  # 用於文件和路徑操作
 import re  # 用於正則表達式 (提取 ID)
 import traceback  # 用於打印詳細的錯誤堆棧信息
+import contextlib  # 用於管理借出的 WebDriver
 import pandas as pd  # 用於讀寫 Excel 文件
 from tqdm import tqdm  # 用於顯示進度條
 from bs4 import BeautifulSoup  # 用於解析 HTML
 
 # --- Selenium 相關導入 (使用標準 Selenium) ---
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from webdriver_manager.chrome import ChromeDriverManager
+from driverpool import checkout  # 共用的 WebDriver 池
 from selenium.common.exceptions import (
     WebDriverException,
     TimeoutException,
@@ -45,22 +43,8 @@ DELAY_LIST_PAGE_NAV = 5  # 訪問不同列表頁之間的延遲 (秒)
 DELAY_DETAIL_PAGE_NAV = 4  # 訪問不同詳細頁之間的延遲 (秒)
 EXPLICIT_WAIT_TIMEOUT = 25  # 顯式等待的最長超時時間 (秒)
 
-# --- Selenium WebDriver 選項設定 (採納您驗證有效的選項) ---
-CHROME_OPTIONS = ChromeOptions()
-# CHROME_OPTIONS.add_argument("--headless")             # 建議先註釋掉，方便調試時觀察瀏覽器
-CHROME_OPTIONS.add_argument("--disable-gpu")
-CHROME_OPTIONS.add_argument("--no-sandbox")
-CHROME_OPTIONS.add_argument("--disable-dev-shm-usage")
-# *** 關鍵選項：禁用 Blink 特性中的自動化控制標誌 ***
-CHROME_OPTIONS.add_argument("--disable-blink-features=AutomationControlled")
-# 設置 User-Agent
-CHROME_OPTIONS.add_argument(
-    "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-)  # 來自您的有效代碼
-# 其他可能有用的選項
-CHROME_OPTIONS.add_experimental_option("excludeSwitches", ["enable-automation"])
-CHROME_OPTIONS.add_experimental_option("useAutomationExtension", False)
-CHROME_OPTIONS.add_argument("--window-size=1920,1080")
+# --- Selenium WebDriver 選項 ---
+# Chrome 參數統一由 driverpool.buildOptions 設定; 此腳本以非 headless 模式借出, 方便調試時觀察瀏覽器
 
 # --- 輔助函數 (用於 Excel 操作和 ID 提取) ---
 
@@ -283,13 +267,11 @@ if __name__ == "__main__":
 
     # --- 初始化 Selenium WebDriver ---
     driver = None
+    browser = contextlib.ExitStack()  # 結束時把 driver 歸還 WebDriver 池
     try:
         print("\n正在初始化 WebDriver...")
-        service = ChromeService(ChromeDriverManager().install())
-        # 使用包含有效選項的 CHROME_OPTIONS
-        driver = webdriver.Chrome(service=service, options=CHROME_OPTIONS)
+        driver = browser.enter_context(checkout(headless=False))
         print("WebDriver 初始化成功。")
-        driver.set_page_load_timeout(60)  # 設置頁面加載超時
 
         # 可選：先訪問主頁
         print(f"嘗試訪問主頁: {BASE_URL}")
@@ -302,8 +284,7 @@ if __name__ == "__main__":
             or "Just a moment" in driver.title
         ):
             print("錯誤：訪問主頁時顯示 403/Access Denied/Cloudflare。程序將終止。")
-            if driver:
-                driver.quit()
+            browser.close()
             exit()
     except WebDriverException as e:
         print(f"WebDriver 初始化失敗: {e}")
@@ -311,8 +292,8 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"初始化過程中發生未知錯誤: {e}")
         traceback.print_exc()
-    if driver:
-        driver.quit()
+    if not driver:
+        browser.close()
         exit()
 
     # --- 開始爬取循環 ---
@@ -321,7 +302,7 @@ if __name__ == "__main__":
     print(f"\n開始爬取 Jable.tv 最新的 {max_pages} 頁影片...")
     print("-" * 30)
 
-    try:  # 主循環 try...finally 確保 driver.quit() 被調用
+    try:  # 主循環 try...finally 確保 driver 被歸還
         for page_num in tqdm(
             range(1, max_pages + 1), desc="總體進度 (頁數)", unit="頁"
         ):
@@ -455,10 +436,10 @@ if __name__ == "__main__":
 
     finally:  # --- 確保關閉瀏覽器 ---
         if driver:
-            print("\n正在關閉 WebDriver...")
+            print("\n正在歸還 WebDriver...")
             try:
-                driver.quit()
-                print("WebDriver 已關閉。")
+                browser.close()
+                print("WebDriver 已歸還。")
             except OSError as e:
                 print(f"關閉 WebDriver 時發生 OSError (可能正常): {e}")
             except Exception as e:
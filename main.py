@@ -6,14 +6,20 @@
 from args import get_parser, av_recommand  # Modified import
 from download import download
 from movies import movieLinks
+from scheduler import runBatch
+from encode import waitEncodes
+from encodebench import benchmarkProfiles
+from catalog import connect, saveVideos, countVideos, countSearch, iterLatest, iterSearch, iterRanked
+from config import DB_PATH
+import metrics
 
 # --- Imports from getList.py ---
 import time
+import itertools
 import os
 import re
 import sqlite3
 import sys
-import datetime
 import json
 from urllib.parse import urlparse
 from bs4 import BeautifulSoup
@@ -22,10 +28,7 @@ from tkinter import filedialog
 
 # Selenium 相關導入 (Ensure these are installed: pip install selenium webdriver-manager beautifulsoup4)
 try:
-    from selenium import webdriver
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.chrome.service import Service
-    from webdriver_manager.chrome import ChromeDriverManager
+    from driverpool import checkout
 
     SELENIUM_AVAILABLE = True
 except ImportError:
@@ -34,9 +37,6 @@ except ImportError:
     print("請執行 'pip install selenium webdriver-manager beautifulsoup4' 來安裝。")
 
 # --- Settings from getList.py ---
-# 資料庫設定 (使用相對路徑)
-DB_PATH = "test.db"
-
 # URL 模板
 URL_TEMPLATES = {
     "latest": "https://jable.tv/latest-updates/?mode=async&function=get_block&block_id=list_videos_latest_videos_list&sort_by=post_date&from=",
@@ -63,116 +63,44 @@ COMMON_OPTIONS = {
 
 # --- 資料庫相關函數 ---
 def setup_database():
-    """設置資料庫，如果不存在則創建"""
-    db_dir = os.path.dirname(DB_PATH)
-    if db_dir and not os.path.exists(db_dir):  # Check if db_dir is not empty
-        os.makedirs(db_dir)
-        print(f"已創建目錄: {db_dir}")
-
-    conn = sqlite3.connect(DB_PATH)
+    """取得資料庫連線 (不存在時建立並更新結構)"""
+    conn = connect()
     print(f"已連接到資料庫: {DB_PATH}")
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-    CREATE TABLE IF NOT EXISTS av_db (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        fanhao TEXT UNIQUE,
-        url TEXT,
-        title TEXT,
-        crawl_date TEXT,
-        crawl_type TEXT,
-        crawl_value TEXT
-    )
+    return conn, conn.cursor()
+
+
+def search_videos_in_python(keyword, ranked=True):
+    """搜尋標題或番號, 回傳逐筆產生結果的 generator
+
+    ranked 時依相關度排序 (互動瀏覽), 否則依收錄日期由新到舊以 keyset 分頁 (匯出).
     """
-    )
-    conn.commit()
-    return conn, cursor
-
-
-def check_db_structure(conn, cursor):
-    """檢查資料庫結構"""
-    cursor.execute("PRAGMA table_info(av_db)")
-    columns = cursor.fetchall()
-    column_names = [column[1] for column in columns]
-    if "crawl_date" not in column_names:
-        print("添加 crawl_date 欄位到資料表")
-        cursor.execute("ALTER TABLE av_db ADD COLUMN crawl_date TEXT")
-        conn.commit()
-    if "crawl_type" not in column_names:
-        print("添加 crawl_type 欄位到資料表")
-        cursor.execute("ALTER TABLE av_db ADD COLUMN crawl_type TEXT")
-        conn.commit()
-    if "crawl_value" not in column_names:
-        print("添加 crawl_value 欄位到資料表")
-        cursor.execute("ALTER TABLE av_db ADD COLUMN crawl_value TEXT")
-        conn.commit()
-
-
-def search_videos_in_python(keyword):
-    """在 Python 中進行過濾搜尋"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT fanhao, url, title, crawl_date FROM av_db")
-        all_records = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
-        keyword_lower = keyword.lower()
-        results = []
-        for record in all_records:
-            fanhao, url, title, crawl_date = record
-            if (title and keyword_lower in title.lower()) or (
-                fanhao and keyword_lower in fanhao.lower()
-            ):
-                results.append((fanhao, url, title, crawl_date))
-        return results
-    except Exception as e:
-        print(f"搜尋時發生錯誤: {e}")
-        return []
+    conn = connect()
+    return iterRanked(conn, keyword) if ranked else iterSearch(conn, keyword)
 
 
 def get_latest_videos_from_db(limit=20):  # Renamed to avoid conflict if needed
-    """獲取最新的影片（按照收錄日期排序）"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT fanhao, url, title, crawl_date
-            FROM av_db
-            ORDER BY crawl_date DESC, id DESC
-            LIMIT ?
-        """,
-            (limit,),
-        )
-        latest_records = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return latest_records
-    except Exception as e:
-        print(f"獲取最新影片時發生錯誤: {e}")
-        return []
+    """獲取最新的影片（按照收錄日期排序）, 回傳逐筆產生結果的 generator"""
+    return itertools.islice(iterLatest(connect()), limit)
 
 
-def export_to_file(keyword, results, is_latest=False):
-    """將搜尋結果匯出到檔案"""
+def export_to_file(keyword, results, is_latest=False, total=None):
+    """將結果逐筆寫入檔案, results 可為 generator, 不需一次載入記憶體"""
     try:
         if is_latest:
             filename = "latest_videos.txt"
-            title_line = f"最新收錄的 {len(results)} 部影片"
+            title_line = f"最新收錄的 {total} 部影片"
         else:
             # Sanitize keyword for filename
             safe_keyword = "".join(c if c.isalnum() else "_" for c in keyword)
             filename = f"{safe_keyword}.txt"
-            title_line = f"關鍵字 '{keyword}' 的搜尋結果"
+            title_line = f"關鍵字 '{keyword}' 的搜尋結果 (共 {total} 筆)"
 
+        count = 0
         with open(filename, "w", encoding="utf-8") as f:
             f.write(f"{title_line}:\n")
             f.write("=" * 80 + "\n\n")
-            for i, (fanhao, url, title, crawl_date) in enumerate(results, 1):
-                f.write(f"{i}. {title}\n")
+            for count, (fanhao, url, title, crawl_date) in enumerate(results, 1):
+                f.write(f"{count}. {title}\n")
                 f.write(f"   番號: {fanhao}\n")
                 f.write(f"   網址: {url}\n")
                 if crawl_date:
@@ -180,9 +108,9 @@ def export_to_file(keyword, results, is_latest=False):
                 f.write("\n")
             f.write("-" * 80 + "\n")
             if is_latest:
-                f.write(f"共列出 {len(results)} 個最新收錄的影片\n")
+                f.write(f"共列出 {count} 個最新收錄的影片\n")
             else:
-                f.write(f"共找到 {len(results)} 個符合關鍵字 '{keyword}' 的影片\n")
+                f.write(f"共找到 {count} 個符合關鍵字 '{keyword}' 的影片\n")
         print(f"結果已匯出到檔案: {filename}")
         return True
     except Exception as e:
@@ -190,9 +118,9 @@ def export_to_file(keyword, results, is_latest=False):
         return False
 
 
-def print_results(results, keyword=None, is_latest=False):
-    """在控制台顯示結果"""
-    if not results:
+def print_results(results, keyword=None, is_latest=False, total=0, page_size=10):
+    """在控制台逐頁顯示結果, results 可為 generator, 只讀取顯示到的部分"""
+    if not total:
         if is_latest:
             print("資料庫中沒有找到任何影片")
         else:
@@ -200,54 +128,27 @@ def print_results(results, keyword=None, is_latest=False):
         return
 
     if is_latest:
-        print(f"\n資料庫中最新收錄的 {len(results)} 部影片:")
+        print(f"\n資料庫中最新收錄的 {total} 部影片:")
     else:
-        print(f"\n找到 {len(results)} 個符合關鍵字 '{keyword}' 的影片:")
+        print(f"\n找到 {total} 個符合關鍵字 '{keyword}' 的影片:")
     print("-" * 80)
-    for i, (fanhao, url, title, crawl_date) in enumerate(
-        results[:10], 1
-    ):  # 只顯示前10個
-        print(f"{i}. {title}")
-        print(f"   番號: {fanhao}")
-        if crawl_date:
-            print(f"   收錄日期: {crawl_date}")
-    if len(results) > 10:
-        print(
-            f"\n...還有 {len(results) - 10} 個結果未顯示，請查看匯出的檔案以獲取完整列表"
-        )
-
-
-# --- 爬蟲相關函數 ---
-def setup_selenium_with_proxy():
-    """設置 Selenium 並使用代理 (如果需要)"""
-    if not SELENIUM_AVAILABLE:
-        print("Selenium 不可用，無法啟動爬蟲。")
-        return None
-
-    options = Options()
-    # 添加代理設定 (如果需要)
-    # proxy = "http://your_proxy_server:port"
-    # options.add_argument(f"--proxy-server={proxy}")
-    options.add_argument("--headless")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument(
-        "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    )
-
     try:
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=options)
-        driver.set_page_load_timeout(30)
-        return driver
+        for i, (fanhao, url, title, crawl_date) in enumerate(results, 1):
+            print(f"{i}. {title}")
+            print(f"   番號: {fanhao}")
+            if crawl_date:
+                print(f"   收錄日期: {crawl_date}")
+            if i % page_size == 0 and i < total:
+                more = input(
+                    f"\n-- 第 {i} / {total} 筆, 按 Enter 顯示下一頁, 輸入 q 結束 -- "
+                ).strip().lower()
+                if more == "q":
+                    break
     except Exception as e:
-        print(f"啟動 Selenium 時出錯: {e}")
-        print("請確保 Chrome 瀏覽器已安裝，或 ChromeDriver 路徑正確。")
-        return None
+        print(f"讀取結果時發生錯誤: {e}")
 
 
+# --- 爬蟲相關函數 ---
 def get_page_with_selenium(driver, url):
     """使用 Selenium 獲取頁面內容"""
     if not driver:
@@ -307,52 +208,15 @@ def parse_videos(html_content):
     return videos
 
 
-def get_existing_fanhaos(cursor):
-    """獲取資料庫中已存在的所有番號"""
-    cursor.execute("SELECT fanhao FROM av_db")
-    return {row[0] for row in cursor.fetchall()}
-
-
-def save_to_database(
-    conn, cursor, videos, existing_fanhaos, crawl_type="latest", crawl_value=""
-):
-    """保存視頻到資料庫，跳過已存在的番號，並返回是否發現已存在的影片"""
-    found_existing = False
-    new_videos_count = 0
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-
-    for video in videos:
-        fanhao = video.get("f")  # 使用 .get() 避免 KeyError
-        if not fanhao or fanhao in existing_fanhaos:
-            # print(f"跳過已存在或無效番號: {fanhao}") # 可以取消註釋以顯示更多信息
-            if fanhao in existing_fanhaos:
-                found_existing = True  # 只有當番號確實存在時才標記
-            continue
-
-        try:
-            cursor.execute(
-                "INSERT INTO av_db (fanhao, url, title, crawl_date, crawl_type, crawl_value) VALUES (?, ?, ?, ?, ?, ?)",
-                (
-                    fanhao,
-                    video.get("u"),
-                    video.get("t"),
-                    current_date,
-                    crawl_type,
-                    crawl_value,
-                ),
-            )
-            existing_fanhaos.add(fanhao)
-            new_videos_count += 1
-            print(f"已保存: {fanhao} - {video.get('t')} - 爬取日期: {current_date}")
-        except sqlite3.IntegrityError:
-            print(f"番號已存在 (衝突): {fanhao}")
-            found_existing = True
-        except Exception as e:
-            print(f"保存視頻 '{fanhao}' 時出錯: {e}")
-
-    conn.commit()
-    print(f"本頁新增了 {new_videos_count} 個新影片")
-    return found_existing
+def save_to_database(conn, videos, crawl_type="latest", crawl_value=""):
+    """批次保存一頁視頻到資料庫，跳過已存在的番號，並返回是否發現已存在的影片"""
+    try:
+        new_videos_count, existing_count = saveVideos(conn, videos, crawl_type, crawl_value)
+    except sqlite3.Error as e:
+        print(f"保存視頻時出錯: {e}")
+        return False
+    print(f"本頁新增了 {new_videos_count} 個新影片, {existing_count} 個已存在")
+    return existing_count > 0
 
 
 def crawl_videos_by_type():
@@ -363,9 +227,7 @@ def crawl_videos_by_type():
 
     try:
         conn, cursor = setup_database()
-        check_db_structure(conn, cursor)
-        existing_fanhaos = get_existing_fanhaos(cursor)
-        print(f"資料庫中已有 {len(existing_fanhaos)} 個影片")
+        print(f"資料庫中已有 {countVideos(conn)} 個影片")
 
         print("\n請選擇爬取類型:")
         print("1. 最新影片")
@@ -377,7 +239,6 @@ def crawl_videos_by_type():
 
         if crawl_type_choice == "0":
             cursor.close()
-            conn.close()
             return
 
         url_template = ""
@@ -420,7 +281,6 @@ def crawl_videos_by_type():
         else:
             print("無效的選擇，返回主選單")
             cursor.close()
-            conn.close()
             return
 
         max_pages = 0
@@ -434,7 +294,6 @@ def crawl_videos_by_type():
                 max_pages = int(pages_input)
                 if max_pages == 0:
                     cursor.close()
-                    conn.close()
                     return
                 elif max_pages > 0:
                     break
@@ -445,20 +304,15 @@ def crawl_videos_by_type():
             except EOFError:
                 print("\n檢測到輸入終止符。返回主選單。")
                 cursor.close()
-                conn.close()
                 return
 
-        driver = setup_selenium_with_proxy()
-        if not driver:
-            cursor.close()
-            conn.close()
-            return  # Exit if driver setup failed
-
         try:
             for page in range(1, max_pages + 1):
                 page_url = url_template + str(page)
                 print(f"\n--- 正在爬取第 {page} 頁 ---")
-                html_content = get_page_with_selenium(driver, page_url)
+                # 每頁從 WebDriver 池借出瀏覽器, 代理設定見 config.DRIVER_PROXY
+                with checkout() as driver:
+                    html_content = get_page_with_selenium(driver, page_url)
                 if not html_content:
                     print(f"無法獲取第 {page} 頁內容，可能需要檢查網路或代理。")
                     continue  # 或 break，取決於是否要繼續嘗試後續頁面
@@ -466,7 +320,7 @@ def crawl_videos_by_type():
                 videos = parse_videos(html_content)
                 if videos:
                     found_existing = save_to_database(
-                        conn, cursor, videos, existing_fanhaos, crawl_type, crawl_value
+                        conn, videos, crawl_type, crawl_value
                     )
                     # 如果爬取最新影片且遇到已存在的影片，可以選擇停止
                     if crawl_type == "latest" and found_existing:
@@ -487,18 +341,11 @@ def crawl_videos_by_type():
                 time.sleep(2)  # 增加延遲避免過快請求
 
         finally:
-            if driver:
-                driver.quit()
             cursor.close()
-            conn.close()
             print("\n爬取完成。")
 
     except Exception as e:
         print(f"爬取過程中發生未預期錯誤: {e}")
-        if "conn" in locals() and conn:
-            conn.close()
-        if "driver" in locals() and driver:
-            driver.quit()
 
 
 # --- 搜尋與列出功能 ---
@@ -509,13 +356,18 @@ def search_videos():
         print("未輸入關鍵字。")
         return
 
-    results = search_videos_in_python(keyword)
-    print_results(results, keyword=keyword)
+    try:
+        total = countSearch(connect(), keyword)
+    except Exception as e:
+        print(f"搜尋時發生錯誤: {e}")
+        return
+    print_results(search_videos_in_python(keyword), keyword=keyword, total=total)
 
-    if results:
+    if total:
         export = input("是否將結果匯出到檔案? (y/n): ").lower()
         if export == "y":
-            export_to_file(keyword, results)
+            # 匯出時重新查詢, 逐頁寫入檔案
+            export_to_file(keyword, search_videos_in_python(keyword, ranked=False), total=total)
 
 
 def list_latest_videos():
@@ -531,13 +383,17 @@ def list_latest_videos():
         print("輸入無效，使用預設數量。")
         limit = 20
 
-    results = get_latest_videos_from_db(limit)
-    print_results(results, is_latest=True)
+    try:
+        total = min(limit, countVideos(connect()))
+    except Exception as e:
+        print(f"獲取最新影片時發生錯誤: {e}")
+        return
+    print_results(get_latest_videos_from_db(limit), is_latest=True, total=total)
 
-    if results:
+    if total:
         export = input("是否將結果匯出到檔案? (y/n): ").lower()
         if export == "y":
-            export_to_file("latest", results, is_latest=True)
+            export_to_file("latest", get_latest_videos_from_db(limit), is_latest=True, total=total)
 
 
 # --- 下載功能 (從原 main.py 整合) ---
@@ -581,9 +437,7 @@ def download_from_file():
                 print(f"錯誤：檔案 '{file_path}' 中未找到任何網址。")
             else:
                 print(f"從檔案 '{file_path}' 讀取網址...")
-                for url_from_file in urls_from_file:
-                    print(f"開始下載 (批次): {url_from_file}")
-                    download(url_from_file, is_batch=True)  # is_batch=True 自動轉檔
+                runBatch(urls_from_file)  # 批次模式自動轉檔
                 print("檔案中的所有網址處理完畢。")
         except FileNotFoundError:
             print(f"錯誤：找不到檔案 '{file_path}'")
@@ -634,24 +488,39 @@ def show_main_menu():
 if __name__ == "__main__":
     parser = get_parser()
     args = parser.parse_args()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
 
     # 優先處理命令行參數
-    if len(args.url) != 0:
+    if args.bench_encode:
+        print("處理命令行參數 --bench-encode")
+        benchmarkProfiles()
+    elif len(args.url) != 0:
         print(f"處理命令行參數 --url: {args.url}")
-        download(args.url)
+        download(args.url, profile=args.profile)
     elif args.file != "":
         print(f"處理命令行參數 --file: {args.file}")
         # 直接調用下載邏輯，不進入選單
         try:
+            urls_from_file = []
             with open(args.file, "r", encoding="utf-8") as f:
-                urls_from_file = [line.strip() for line in f if line.strip()]
+                for lineno, line in enumerate(f, 1):
+                    # 每行: 網址 [優先度], 優先度數字越大越先下載
+                    parts = line.split()
+                    if not parts:
+                        continue
+                    priority = 0
+                    if len(parts) > 1:
+                        try:
+                            priority = int(parts[1])
+                        except ValueError:
+                            print(f"警告：第 {lineno} 行的優先度 '{parts[1]}' 不是整數，改用 0")
+                    urls_from_file.append((parts[0], priority))
             if not urls_from_file:
                 print(f"錯誤：檔案 '{args.file}' 是空的或只包含空白行。")
             else:
                 print(f"從檔案 '{args.file}' 讀取網址...")
-                for url_from_file in urls_from_file:
-                    print(f"開始下載 (批次): {url_from_file}")
-                    download(url_from_file, is_batch=True)
+                runBatch(urls_from_file, workers=args.workers, profile=args.profile)
                 print("檔案中的所有網址處理完畢。")
         except FileNotFoundError:
             print(f"錯誤：找不到檔案 '{args.file}'")
@@ -661,17 +530,19 @@ if __name__ == "__main__":
         print("處理命令行參數 --random")
         url = av_recommand()
         if url:
-            download(url)
+            download(url, profile=args.profile)
         else:
             print("無法獲取隨機推薦網址。")
     elif args.all_urls != "":
         print(f"處理命令行參數 --all-urls: {args.all_urls}")
         urls = movieLinks(args.all_urls)
         if urls:
-            for url in urls:
-                download(url)  # 這裡可以考慮是否也用 is_batch=True
+            runBatch(urls, workers=args.workers, profile=args.profile)
         else:
             print("無法從該頁面解析出影片連結。")
     else:
         # 如果沒有提供相關的命令行參數，則顯示互動選單
         show_main_menu()
+
+    # 下載已結束, 等待背景轉檔完成後再離開
+    waitEncodes()
@@ -1,20 +1,61 @@
 import os
 import time
+import shutil
+from metrics import metrics
+
+
+def copyInto(src, dst):
+    """把 src 剩下的內容接到 dst 目前的位置, 回傳複製的位元組數
+
+    優先使用 copy_file_range / sendfile 在核心內複製, 資料不經過 Python 記憶體;
+    平台或檔案系統不支援時改用固定大小緩衝區複製.
+    """
+    size = os.fstat(src.fileno()).st_size - src.tell()
+    copied = 0
+    for kernelCopy in (
+        getattr(os, "copy_file_range", None),
+        getattr(os, "sendfile", None) and (lambda s, d, n: os.sendfile(d, s, None, n)),
+    ):
+        if kernelCopy is None:
+            continue
+        try:
+            while copied < size:
+                n = kernelCopy(src.fileno(), dst.fileno(), size - copied)
+                if n == 0:
+                    break
+                copied += n
+            if copied >= size:
+                return copied
+        except OSError:
+            # 例如跨檔案系統或 sendfile 不支援檔案對檔案, 從目前位置改用下一種方式
+            pass
+    before = dst.tell()
+    shutil.copyfileobj(src, dst, 1024 * 1024)
+    return copied + dst.tell() - before
+
+
 def mergeMp4(folderPath, tsList):
 	# 開始時間
     start_time = time.time()
     print('開始合成影片..')
 
-    for i in range(len(tsList)):
-        file = tsList[i].split('/')[-1][0:-3] + '.mp4'
-        full_path = os.path.join(folderPath, file)
-        video_name = folderPath.split(os.path.sep)[-1]
-        if os.path.exists(full_path):
-            with open(full_path, 'rb') as f1:
-                with open(os.path.join(folderPath, video_name + '.mp4'), 'ab') as f2:
-                    f2.write(f1.read())
-        else:
-            print(file + " 失敗 ")
+    video_name = folderPath.split(os.path.sep)[-1]
+    output_path = os.path.join(folderPath, video_name + '.mp4')
+    total = 0
+    # 只開一次輸出檔, 先寫到 .part 完成後再改名
+    with open(output_path + '.part', 'wb', buffering=0) as f2:
+        for i in range(len(tsList)):
+            file = tsList[i].split('/')[-1][0:-3] + '.mp4'
+            full_path = os.path.join(folderPath, file)
+            if os.path.exists(full_path):
+                with open(full_path, 'rb', buffering=0) as f1:
+                    copied = copyInto(f1, f2)
+                    total += copied
+                    metrics.add('merge_bytes_total', copied)
+            else:
+                print(file + " 失敗 ")
+    os.replace(output_path + '.part', output_path)
     end_time = time.time()
-    print('花費 {0:.2f} 秒合成影片'.format(end_time - start_time))
+    elapsed = max(end_time - start_time, 1e-6)
+    print('花費 {0:.2f} 秒合成影片 ({1:.1f} MB/s)'.format(elapsed, total / elapsed / 1048576))
     print('下載完成!')
@@ -0,0 +1,154 @@
+import json
+import time
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PREFIX = "jable_"
+
+
+class Metrics:
+    """下載, 合成與轉檔各階段共用的計數器, 可跨執行緒更新
+
+    由 serve() 啟動的 HTTP 端點以 Prometheus 文字格式 (/metrics) 與 JSON (/metrics.json) 提供.
+    """
+
+    def __init__(self, window=10):
+        self.lock = threading.Lock()
+        self.window = window  # 計算即時速度的時間窗 (秒)
+        self.samples = deque()  # (時間, 位元組)
+        self.created = time.monotonic()
+        self.counters = {
+            "bytes_total": 0,
+            "segments_total": 0,
+            "retries_total": 0,
+            "failures_total": 0,
+            "merge_bytes_total": 0,
+            "encodes_total": 0,
+            "encode_failures_total": 0,
+        }
+        self.inFlight = 0
+        self.encodeBacklog = 0
+        self.titles = {}  # 影片 -> {"total", "done", "queued", "started"}
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def titleStarted(self, label, total):
+        with self.lock:
+            self.titles[label] = {
+                "total": total, "done": 0, "queued": total, "started": time.monotonic()
+            }
+
+    def titleFinished(self, label):
+        with self.lock:
+            self.titles.pop(label, None)
+
+    def requestStarted(self):
+        with self.lock:
+            self.inFlight += 1
+
+    def requestFinished(self):
+        with self.lock:
+            self.inFlight -= 1
+
+    def segmentDone(self, label, size, queued):
+        now = time.monotonic()
+        with self.lock:
+            self.counters["bytes_total"] += size
+            self.counters["segments_total"] += 1
+            self.samples.append((now, size))
+            title = self.titles.get(label)
+            if title is not None:
+                title["done"] += 1
+                title["queued"] = queued
+
+    def encodeQueued(self):
+        with self.lock:
+            self.encodeBacklog += 1
+
+    def encodeFinished(self, ok):
+        with self.lock:
+            self.encodeBacklog -= 1
+            self.counters["encodes_total"] += 1
+            if ok is False:
+                self.counters["encode_failures_total"] += 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.samples and self.samples[0][0] < now - self.window:
+                self.samples.popleft()
+            titles = {}
+            for label, title in self.titles.items():
+                elapsed = now - title["started"]
+                remaining = title["total"] - title["done"]
+                rate = title["done"] / elapsed if elapsed > 0 else 0
+                titles[label] = {
+                    "segments_total": title["total"],
+                    "segments_remaining": remaining,
+                    "queue_depth": title["queued"],
+                    "eta_seconds": round(remaining / rate, 1) if rate else None,
+                }
+            return {
+                **self.counters,
+                "bytes_per_second": round(
+                    sum(size for _, size in self.samples)
+                    / max(min(self.window, now - self.created), 1e-3),
+                    1,
+                ),
+                "segments_in_flight": self.inFlight,
+                "queue_depth": sum(title["queued"] for title in self.titles.values()),
+                "encode_backlog": self.encodeBacklog,
+                "titles": titles,
+            }
+
+    def prometheus(self):
+        snapshot = self.snapshot()
+        titles = snapshot.pop("titles")
+        lines = []
+        for name, value in snapshot.items():
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            lines.append(f"{PREFIX}{name} {value}")
+        for name in ("segments_remaining", "queue_depth", "eta_seconds"):
+            lines.append(f"# TYPE {PREFIX}title_{name} gauge")
+            for label, title in titles.items():
+                if title[name] is not None:
+                    lines.append(f'{PREFIX}title_{name}{{title="{label}"}} {title[name]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = metrics.prometheus().encode()
+            contentType = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode()
+            contentType = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 不在終端機印出每次抓取
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    """在背景執行緒啟動 metrics 端點, 回傳 server"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    print(f"metrics 端點: http://{host}:{server.server_address[1]}/metrics (JSON: /metrics.json)")
+    return server
@@ -1,15 +1,13 @@
 # In[0]:
-import requests
-from config import headers
 from bs4 import BeautifulSoup
-from selenium import webdriver
+from driverpool import checkout
 
 
 def movieLinks(url):
   links = []
-  dr = webdriver.Chrome()
-  dr.get(url)
-  bs = BeautifulSoup(dr.page_source,"html.parser")
+  with checkout() as dr:
+    dr.get(url)
+    bs = BeautifulSoup(dr.page_source,"html.parser")
   a_tags = bs.select('div.img-box>a')
   print(a_tags)
   for a_tag in a_tags:
@@ -0,0 +1,53 @@
+import re
+from bs4 import BeautifulSoup
+from transport import get_client
+from driverpool import checkout
+
+M3U8_PATTERN = re.compile(r"https://[^\s'\"<>]+?\.m3u8")
+
+
+def findM3u8(html):
+    result = M3U8_PATTERN.search(html or "")
+    return result[0] if result else None
+
+
+def findCover(html):
+    """從 meta 標籤找出封面網址"""
+    soup = BeautifulSoup(html, "html.parser")
+    for meta in soup.find_all("meta"):
+        meta_content = meta.get("content")
+        if meta_content and "preview.jpg" in meta_content:
+            return meta_content
+    return None
+
+
+def renderPage(url):
+    """用瀏覽器渲染頁面, Chrome 由 WebDriver 池借出並重複使用"""
+    with checkout() as driver:
+        driver.get(url)
+        return driver.page_source
+
+
+def fetchPage(url):
+    """取得影片頁面與 m3u8 網址
+
+    先用一般 HTTP 請求解析, 失敗 (被擋或頁面由 JS 產生) 才退回瀏覽器渲染.
+    回傳 (html, m3u8url).
+    """
+    html = ""
+    try:
+        response = get_client().get(url)
+        if response.status_code == 200:
+            html = response.text
+        else:
+            print(f"頁面回應 status code: {response.status_code}")
+    except Exception as e:
+        print(f"取得頁面失敗: {e}")
+    m3u8url = findM3u8(html)
+    if m3u8url is None:
+        print("無法直接解析 m3u8, 改用瀏覽器載入頁面...")
+        html = renderPage(url)
+        m3u8url = findM3u8(html)
+    if m3u8url is None:
+        raise RuntimeError(f"找不到 m3u8 網址: {url}")
+    return html, m3u8url
@@ -0,0 +1,142 @@
+import os
+import asyncio
+import concurrent.futures
+from transport import get_client
+from config import RANGE_PARTS, RANGE_MIN_SIZE
+from throttle import requestSlot
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+def splitRanges(size, parts):
+    """把 [0, size) 切成 parts 段, 回傳 (start, end) 列表, end 為包含端點"""
+    step = -(-size // parts)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def _contentRangeSize(value):
+    # "bytes 0-0/12345"
+    try:
+        return int(value.rsplit("/", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def probe(url):
+    """回傳 (檔案大小, 是否支援 Range), 先用 HEAD, 不明確時再用 bytes=0-0 試探"""
+    client = get_client()
+    response = client.head(url)
+    size = response.headers.get("Content-Length")
+    if response.status_code == 200 and response.headers.get("Accept-Ranges") == "bytes" and size:
+        return int(size), True
+    with client.stream("GET", url, headers={"Range": "bytes=0-0"}) as response:
+        if response.status_code == 206:
+            size = _contentRangeSize(response.headers.get("Content-Range"))
+            if size:
+                return size, True
+        return int(response.headers.get("Content-Length") or 0), False
+
+
+def _streamToFile(url, path):
+    with get_client().stream("GET", url) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for chunk in response.iter_bytes(chunk_size=1048576):
+                f.write(chunk)
+
+
+def _fetchRange(url, path, start, end):
+    headers = {"Range": f"bytes={start}-{end}"}
+    with get_client().stream("GET", url, headers=headers) as response:
+        if response.status_code != 206:
+            raise RangeNotSupported(f"status code: {response.status_code}")
+        with open(path, "r+b") as f:
+            f.seek(start)
+            for chunk in response.iter_bytes(chunk_size=1048576):
+                f.write(chunk)
+            if f.tell() != end + 1:
+                raise IOError(f"片段 {start}-{end} 長度不符")
+
+
+def fetchToFile(url, path, parts=RANGE_PARTS, minSize=RANGE_MIN_SIZE):
+    """下載單一檔案並直接寫入磁碟, 不把整個內容留在記憶體
+
+    伺服器支援 Range 且檔案大於 minSize 時, 分成 parts 段並行下載寫入各自的位置,
+    否則 (或分段失敗時) 退回單一串流下載.
+    """
+    tmpPath = path + ".tmp"
+    try:
+        try:
+            size, ranged = probe(url)
+        except Exception:
+            size, ranged = 0, False
+        if ranged and size >= minSize and parts > 1:
+            try:
+                with open(tmpPath, "wb") as f:
+                    f.truncate(size)
+                bounds = splitRanges(size, parts)
+                with concurrent.futures.ThreadPoolExecutor(len(bounds)) as executor:
+                    list(executor.map(lambda b: _fetchRange(url, tmpPath, *b), bounds))
+                os.replace(tmpPath, path)
+                return
+            except RangeNotSupported as e:
+                print(f"伺服器不支援分段下載 ({e}), 改用單一連線")
+        _streamToFile(url, tmpPath)
+        os.replace(tmpPath, path)
+    except BaseException:
+        # 下載失敗時不留下寫到一半的暫存檔
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+
+async def fetchBytesAsync(client, url, parts=RANGE_PARTS, minSize=RANGE_MIN_SIZE):
+    """片段用的非同步版本, 回傳 (status code, 內容, headers)
+
+    只有少數超大片段的播放清單才值得多花一次 HEAD 試探, 由呼叫端決定是否使用.
+    每個請求 (含 HEAD 與各段) 各自取得 throttle 的主機速率與共用名額.
+    """
+
+    async def get(headers=None):
+        async with requestSlot(url):
+            return await client.get(url, headers=headers)
+
+    async with requestSlot(url):
+        response = await client.head(url)
+    size = int(response.headers.get("Content-Length") or 0)
+    if (
+        response.status_code != 200
+        or response.headers.get("Accept-Ranges") != "bytes"
+        or size < minSize
+    ):
+        response = await get()
+        return response.status_code, response.content, response.headers
+
+    async def fetchRange(start, end):
+        part = await get({"Range": f"bytes={start}-{end}"})
+        if part.status_code != 206 or len(part.content) != end - start + 1:
+            raise RangeNotSupported(f"status code: {part.status_code}")
+        return start, part.content
+
+    tasks = [
+        asyncio.ensure_future(fetchRange(start, end)) for start, end in splitRanges(size, parts)
+    ]
+    try:
+        results = await asyncio.gather(*tasks)
+    except RangeNotSupported:
+        results = None
+    finally:
+        # 任一段失敗 (或整個片段逾時被取消) 時, 停止其餘仍在下載的分段
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if results is None:
+        response = await get()
+        return response.status_code, response.content, response.headers
+
+    buffer = bytearray(size)
+    for start, content in results:
+        buffer[start : start + len(content)] = content
+    return 200, bytes(buffer), response.headers
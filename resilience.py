@@ -0,0 +1,104 @@
+"""以注入錯誤的本機 HLS 伺服器驗證下載流程在 CDN 常見錯誤下的表現
+
+    python resilience.py               # 執行所有情境
+    python resilience.py --only resets # 只執行指定情境
+
+每個情境檢查: 該成功的要成功且輸出檔雜湊正確, 該失敗的要在時限內回報 DownloadError,
+總耗時不得超過依無錯誤時的耗時與重試設定推算出的上限. 任何情境不符合時以狀態碼 1 結束.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from config import SEGMENT_TIMEOUT, RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+from retry import DownloadError
+from timing import StageTimer
+from benchmark import runPipeline, fileDigest
+from hlsserver import HlsServer, SyntheticTitle, Faults
+
+# 一個片段用完所有重試次數時, 退避等待時間的上限
+BACKOFF_LIMIT = sum(
+    min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    for attempt in range(1, RETRY_MAX_ATTEMPTS)
+)
+
+# (名稱, Faults 參數, 伺服器參數, 是否應成功, 時限 = baseline 倍數 + 額外秒數)
+SCENARIOS = [
+    ("status", dict(status={403: 0.02, 429: 0.05, 500: 0.03, 502: 0.03, 503: 0.03}), {}, True, (3, 10)),
+    ("resets", dict(drop=0.05, truncate=0.05), {}, True, (3, 10)),
+    ("delays", dict(delay=0.05, delaySeconds=2), {}, True, (3, 6)),
+    ("slowloris", dict(slow=0.02, slowSeconds=SEGMENT_TIMEOUT * 2), {}, True, (3, SEGMENT_TIMEOUT + 10)),
+    ("mixed", dict(status={429: 0.03, 503: 0.03}, drop=0.02, truncate=0.02, delay=0.02), {}, True, (4, 15)),
+    ("signed", dict(ttl=3600), {}, True, (2, 5)),
+    ("expired", dict(ttl=1), dict(latency=0.05, bandwidth=1048576), False, (2, BACKOFF_LIMIT + 10)),
+]
+
+
+def runScenario(name, faults, serverArgs, segments, size, seed):
+    """回傳 (是否成功, 耗時, 輸出檔是否正確, 錯誤訊息, 注入次數)"""
+    workDir = tempfile.mkdtemp(prefix="jable_resilience_")
+    title = SyntheticTitle(name, segments, size, seed=seed)
+    error = ""
+    verified = None
+    try:
+        with HlsServer([title], faults=faults, **serverArgs) as server:
+            started = time.perf_counter()
+            try:
+                outputPath = runPipeline(
+                    server.url(name), os.path.join(workDir, name), timer=StageTimer(name)
+                )
+                ok = True
+            except DownloadError as e:
+                ok = False
+                error = str(e)
+            elapsed = time.perf_counter() - started
+        if ok:
+            verified = fileDigest(outputPath) == title.digest
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+    return ok, elapsed, verified, error, dict(faults.injected) if faults else {}
+
+
+def main(only, segments, size, seed):
+    print("執行無錯誤的基準情境...")
+    ok, baseline, verified, error, _ = runScenario("baseline", None, {}, segments, size, seed)
+    if not (ok and verified):
+        print(f"基準情境失敗: {error or '輸出檔雜湊不符'}")
+        return 1
+
+    rows = [("baseline", True, baseline, baseline, verified, "", {}, True)]
+    for name, faultArgs, serverArgs, expectOk, (factor, extra) in SCENARIOS:
+        if only and name not in only:
+            continue
+        print(f"\n執行情境 {name}...")
+        ok, elapsed, verified, error, injected = runScenario(
+            name, Faults(seed=seed, **faultArgs), serverArgs, segments, size, seed
+        )
+        limit = baseline * factor + extra
+        passed = ok == expectOk and elapsed <= limit and verified is not False
+        rows.append((name, ok, elapsed, limit, verified, error, injected, passed))
+
+    print("\n" + "=" * 80)
+    print(f"{'情境':<10}{'結果':<6}{'耗時(秒)':>10}{'上限(秒)':>10}  {'驗證':<6}注入")
+    for name, ok, elapsed, limit, verified, error, injected, passed in rows:
+        mark = "" if passed else "  <-- 不符預期"
+        check = "-" if verified is None else ("通過" if verified else "失敗")
+        print(f"{name:<12}{'完成' if ok else '失敗':<6}{elapsed:10.2f}{limit:10.2f}  {check:<6}{injected}{mark}")
+        if error:
+            print(f"            {error}")
+    print("=" * 80)
+    failed = [row[0] for row in rows if not row[-1]]
+    print("全部情境符合預期" if not failed else f"不符預期的情境: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fault-injection resilience checks for the download pipeline")
+    parser.add_argument("--only", nargs="*", default=[], help="Scenario names to run")
+    parser.add_argument("--segments", type=int, default=200, help="Segments per title")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="Plaintext bytes per segment")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for titles and injected faults")
+    args = parser.parse_args()
+    sys.exit(main(args.only, args.segments, args.size, args.seed))
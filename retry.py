@@ -0,0 +1,49 @@
+import random
+import asyncio
+import httpx
+
+# 逾時、連線中斷、伺服器錯誤與限流可以重試; 找不到檔案或權限錯誤重試也沒用
+RETRYABLE_STATUS = {403, 408, 425, 429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    pass
+
+
+def classify(status=None, error=None):
+    """判斷一次失敗是否值得重試, 回傳 (可重試, 原因)"""
+    if error is not None:
+        reason = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+        if isinstance(
+            error, (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError)
+        ):
+            return True, reason
+        if isinstance(error, ValueError):
+            # 解碼時長度不是 16 的倍數, 通常是內容被截斷
+            return True, reason
+        return False, reason
+    if status in RETRYABLE_STATUS:
+        return True, f"HTTP {status}"
+    return False, f"HTTP {status}"
+
+
+class RetryPolicy:
+    """指數退避加隨機抖動 (full jitter), 每個片段最多嘗試 maxAttempts 次"""
+
+    def __init__(self, maxAttempts, baseDelay, maxDelay):
+        self.maxAttempts = maxAttempts
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+
+    def delay(self, attempt, retryAfter=None):
+        delay = random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** (attempt - 1)))
+        if retryAfter:
+            delay = max(delay, min(retryAfter, self.maxDelay))
+        return delay
+
+
+def retryAfter(headers):
+    try:
+        return float(headers.get("Retry-After", ""))
+    except (TypeError, ValueError):
+        return None
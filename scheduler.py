@@ -0,0 +1,86 @@
+import time
+import heapq
+import threading
+from download import download
+from encode import waitEncodes
+from config import BATCH_WORKERS
+from catalog import normalizeFanhao
+
+
+def runBatch(items, workers=BATCH_WORKERS, profile=False):
+    """同時下載多部影片
+
+    items 為網址或 (網址, 優先度) 的列表, 優先度數字越大越先開始;
+    同一番號 (含大小寫與寫法不同的網址) 只下載一次, 取最高的優先度.
+    片段並發由 throttle.budget 在所有影片間共用, 單部影片卡住不會擋住其他影片.
+    profile 時每部影片另寫出 cProfile 記錄, 並改為一次只下載一部 (見 timing.profiled).
+    結束時列出每部影片的結果並回傳.
+    """
+    if profile and workers > 1:
+        print(f"--profile 一次只能記錄一部影片, 同時下載數由 {workers} 改為 1")
+        workers = 1
+    unique = {}
+    for seq, item in enumerate(items):
+        url, priority = item if isinstance(item, tuple) else (item, 0)
+        key = titleKey(url)
+        if key in unique:
+            if priority <= -unique[key][0]:
+                print(f"重複的影片, 略過: {url}")
+                continue
+            print(f"重複的影片, 略過: {unique[key][2]}")
+        unique[key] = (-priority, seq, url)
+    queue = list(unique.values())
+    heapq.heapify(queue)
+    total = len(queue)
+    lock = threading.Lock()
+    results = []
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                _, seq, url = heapq.heappop(queue)
+                print(f"\n[{total - len(queue)}/{total}] 開始下載 (批次): {url}")
+            start_time = time.time()
+            error = ""
+            try:
+                status = "完成" if download(url, is_batch=True, profile=profile) else "已存在"
+            except Exception as e:
+                status = "失敗"
+                error = f"{type(e).__name__}: {e}"
+                print(f"\n下載 {url} 失敗: {error}")
+            with lock:
+                results.append((seq, url, status, time.time() - start_time, error))
+                print(f"\n[{len(results)}/{total}] {status}: {url}")
+
+    threads = [
+        threading.Thread(target=worker, name=f"batch-{i}")
+        for i in range(min(workers, total))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    waitEncodes()
+
+    printReport(results)
+    return results
+
+
+def titleKey(url):
+    # 網址倒數第二段為番號, 無法辨識時以網址本身區分
+    return normalizeFanhao(url.rstrip("/").split("/")[-1]) or url
+
+
+def printReport(results):
+    results = sorted(results)
+    failed = [r for r in results if r[2] == "失敗"]
+    print("\n" + "=" * 80)
+    print(f"批次下載結束: 共 {len(results)} 部, 失敗 {len(failed)} 部")
+    print("-" * 80)
+    for _, url, status, elapsed, error in results:
+        print(f"{status:<4} {elapsed / 60:6.2f} 分鐘  {url}")
+        if error:
+            print(f"     {error}")
+    print("=" * 80)
@@ -1,37 +1,12 @@
-import sqlite3
 import os
 import sys
-
-# 資料庫路徑
-DB_PATH = "D:\\jable\\spider_for_jable.tv\\test.db"
+from catalog import connect, searchVideos
+from config import DB_PATH
 
 def search_videos_in_python(keyword):
-    """在 Python 中進行過濾搜尋"""
+    """以全文索引搜尋標題或番號 (依相關度排序)"""
     try:
-        # 連接資料庫
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # 獲取所有記錄
-        cursor.execute("SELECT fanhao, url, title FROM av_db")
-        all_records = cursor.fetchall()
-        
-        # 關閉資料庫連接
-        cursor.close()
-        conn.close()
-        
-        # 在 Python 中進行過濾
-        keyword_lower = keyword.lower()  # 轉為小寫以進行不區分大小寫的搜尋
-        results = []
-        
-        for record in all_records:
-            fanhao, url, title = record
-            # 檢查標題或番號是否包含關鍵字
-            if ((title and keyword_lower in title.lower()) or 
-                (fanhao and keyword_lower in fanhao.lower())):
-                results.append(record)
-        
-        return results
+        return [(fanhao, url, title) for fanhao, url, title, _ in searchVideos(connect(), keyword)]
     except Exception as e:
         print(f"搜尋時發生錯誤: {e}")
         return []
@@ -102,15 +77,10 @@ def main():
         print(f"找不到符合關鍵字 '{keyword}' 的影片")
         
         # 顯示一些標題樣本，幫助確認關鍵字是否正確
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT title FROM av_db LIMIT 10")
-        sample_titles = cursor.fetchall()
+        sample_titles = connect().execute("SELECT title FROM av_db LIMIT 10").fetchall()
         print("\n資料庫中的一些標題樣本:")
         for title in sample_titles:
             print(f"- {title[0]}")
-        cursor.close()
-        conn.close()
 
 if __name__ == "__main__":
     main()
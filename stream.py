@@ -0,0 +1,211 @@
+import os
+import queue
+import asyncio
+import threading
+import subprocess
+
+
+def segmentPath(folderPath, url):
+    fileName = url.split("/")[-1][0:-3]
+    return os.path.join(folderPath, fileName + ".mp4")
+
+
+class SegmentFiles:
+    """每個片段各自存成 <name>.mp4, 之後再由 mergeMp4 合成"""
+
+    # 片段之間互不相依, 某個片段失敗時其他片段仍可繼續下載
+    ordered = False
+
+    def __init__(self, folderPath, journal=None):
+        self.folderPath = folderPath
+        self.journal = journal
+
+    def completed(self, index, url):
+        path = segmentPath(self.folderPath, url)
+        if not os.path.exists(path):
+            return False
+        if self.journal is None:
+            return True
+        # 有下載記錄時, 檔案大小與雜湊都要相符才算完成
+        with open(path, "rb") as f:
+            return self.journal.verify(index, f.read())
+
+    def ready(self, index):
+        return True
+
+    def write(self, index, url, data):
+        # 先寫暫存檔再改名, 中斷時不會留下看似完整的片段
+        path = segmentPath(self.folderPath, url)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        if self.journal is not None:
+            self.journal.record(index, data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class OrderedStream:
+    """依片段順序直接寫入最終輸出檔, 提早完成的片段暫存在重排緩衝區
+
+    輸出先寫到 <output>.part, 全部完成後才改名, 避免中斷的檔案被當成已下載.
+    window 限制緩衝區最多領先目前寫入位置多少個片段, 控制記憶體用量.
+    有下載記錄時, 會逐段驗證既有的 .part, 從第一個不符的片段接續下載.
+    """
+
+    ordered = True
+
+    def __init__(self, outputPath, window, journal=None):
+        self.outputPath = outputPath
+        self.partPath = outputPath + ".part"
+        self.window = window
+        self.journal = journal
+        self.next = 0
+        self.pending = {}
+        if journal is not None and os.path.exists(self.partPath):
+            self.file = open(self.partPath, "r+b")
+            offset = 0
+            while self.next in journal.entries:
+                data = self.file.read(journal.entries[self.next]["size"])
+                if not journal.verify(self.next, data):
+                    break
+                offset += len(data)
+                self.next += 1
+            self.file.seek(offset)
+            self.file.truncate()
+            if self.next:
+                print("已驗證 {0} 個片段, 接續下載".format(self.next))
+        else:
+            self.file = open(self.partPath, "wb")
+
+    def completed(self, index, url):
+        return index < self.next
+
+    def ready(self, index):
+        return index < self.next + self.window
+
+    def write(self, index, url, data):
+        self.pending[index] = data
+        while self.next in self.pending:
+            data = self.pending.pop(self.next)
+            self.file.write(data)
+            if self.journal is not None:
+                self.journal.record(self.next, data)
+            self.next += 1
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.file.close()
+        os.replace(self.partPath, self.outputPath)
+
+    def abort(self):
+        self.file.close()
+
+
+class FfmpegPipe:
+    """依片段順序直接餵給 ffmpeg 的 stdin, 下載的同時進行封裝或轉檔
+
+    寫入 stdin 由獨立執行緒負責, 不阻塞下載的 event loop;
+    積壓超過 window 個片段時, drain() 讓下載端等待 ffmpeg 消化.
+    ffmpeg 的輸出無法接續, 因此這個模式不使用下載記錄.
+    """
+
+    ordered = True
+
+    def __init__(self, outputPath, window, codecArgs):
+        self.outputPath = outputPath
+        self.partPath = outputPath + ".part"
+        self.window = window
+        self.next = 0
+        self.pending = {}
+        self.error = None
+        self.loop = None
+        self.drained = None  # drain() 第一次等待時在下載端的 event loop 建立
+        self.proc = subprocess.Popen(
+            ["ffmpeg", "-y", "-loglevel", "error", "-f", "mpegts", "-i", "pipe:0",
+             *codecArgs, "-f", "mp4", self.partPath],
+            stdin=subprocess.PIPE,
+        )
+        self.chunks = queue.Queue()
+        self.writer = threading.Thread(target=self._pump, name="ffmpeg-pipe", daemon=True)
+        self.writer.start()
+
+    def _pump(self):
+        while True:
+            data = self.chunks.get()
+            if data is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.proc.stdin.write(data)
+            except OSError as e:
+                self.error = e
+                self._wake()
+                continue
+            if self.chunks.qsize() <= self.window:
+                self._wake()
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+
+    def _wake(self):
+        # 由寫入執行緒喚醒在 drain() 等待的下載端
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.drained.set)
+            except RuntimeError:  # event loop 已關閉
+                pass
+
+    def completed(self, index, url):
+        return index < self.next
+
+    def ready(self, index):
+        return index < self.next + self.window
+
+    def write(self, index, url, data):
+        if self.error is not None:
+            raise OSError(f"ffmpeg 已中止: {self.error}")
+        self.pending[index] = data
+        while self.next in self.pending:
+            self.chunks.put(self.pending.pop(self.next))
+            self.next += 1
+
+    async def drain(self):
+        while self.chunks.qsize() > self.window and self.error is None:
+            if self.drained is None:
+                self.drained = asyncio.Event()
+                self.loop = asyncio.get_running_loop()
+            self.drained.clear()
+            # clear 之後再檢查一次, 避免錯過寫入執行緒在這之前發出的喚醒
+            if self.chunks.qsize() <= self.window or self.error is not None:
+                break
+            await self.drained.wait()
+
+    def close(self):
+        self.chunks.put(None)
+        self.writer.join()
+        returncode = self.proc.wait()
+        if returncode != 0 or self.error is not None:
+            raise OSError(f"ffmpeg 轉檔失敗 (return code: {returncode})")
+        os.replace(self.partPath, self.outputPath)
+
+    def abort(self):
+        self.error = self.error or "aborted"
+        self.proc.kill()
+        self.chunks.put(None)
+        self.writer.join()
+        self.proc.wait()
+        if os.path.exists(self.partPath):
+            os.remove(self.partPath)
@@ -0,0 +1,183 @@
+import time
+import asyncio
+import contextlib
+import collections
+import threading
+from urllib.parse import urlparse
+from config import SEGMENT_BUDGET, HOST_RATE_LIMIT
+
+
+class SegmentBudget:
+    """所有影片共用的片段並發上限, 可跨執行緒 (每部影片各自的 event loop) 使用
+
+    拿不到名額的請求在自己的 event loop 上等待 future, release 時直接把名額
+    交給最早等待的請求並以 call_soon_threadsafe 喚醒, 等待期間不佔用 CPU.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.free = size
+        self.titles = 0
+        self.lock = threading.Lock()
+        self.waiters = collections.deque()  # (event loop, future)
+
+    def enter(self):
+        with self.lock:
+            self.titles += 1
+
+    def leave(self):
+        with self.lock:
+            self.titles -= 1
+
+    def share(self):
+        # 目前每部進行中的影片平均可用的名額
+        with self.lock:
+            return max(1, self.size // max(1, self.titles))
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.free > 0 and not self.waiters:
+                self.free -= 1
+                return
+            future = loop.create_future()
+            self.waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self.lock:
+                waiting = (loop, future) in self.waiters
+                if waiting:
+                    self.waiters.remove((loop, future))
+            # 名額已交給這個請求才被取消: 已拿到就歸還, 尚未送達時由 _grant 歸還
+            if not waiting and future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self.lock:
+            if not self.waiters:
+                self.free += 1
+                return
+            loop, future = self.waiters.popleft()
+        try:
+            loop.call_soon_threadsafe(self._grant, future)
+        except RuntimeError:  # 等待的影片已結束, event loop 已關閉
+            self.release()
+
+    def _grant(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class HostRateLimiter:
+    """每個主機各自的 token bucket, rate 為每秒請求數, 0 表示不限制"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def reserve(self, host):
+        """預約一次請求, 回傳需要等待的秒數"""
+        if not self.rate:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            tokens, last = self.buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate) - 1
+            self.buckets[host] = (tokens, now)
+        return 0 if tokens >= 0 else -tokens / self.rate
+
+
+budget = SegmentBudget(SEGMENT_BUDGET)
+hostLimiter = HostRateLimiter(HOST_RATE_LIMIT)
+
+
+@contextlib.asynccontextmanager
+async def requestSlot(url):
+    """單一請求佔用的主機速率與共用片段名額, 請求結束即歸還"""
+    await asyncio.sleep(hostLimiter.reserve(urlparse(url).netloc))
+    await budget.acquire()
+    try:
+        yield
+    finally:
+        budget.release()
+
+
+class AdaptiveLimiter:
+    """單部影片的 AIMD 並發控制
+
+    每完成 limit 個請求評估一次: 錯誤率過高就減半, 吞吐量因加大並發反而下降就退一步,
+    否則加一. 收到 429/403 立即減半, 但只對減半之後才送出的請求再次反應,
+    避免同一批請求把並發一路砍到底.
+    """
+
+    def __init__(self, initial, minimum, maximum, label="", budget=None):
+        self.maximum = maximum
+        self.budget = budget
+        self.minimum = min(minimum, self._ceiling())
+        self.limit = max(self.minimum, min(initial, self._ceiling()))
+        self.label = label
+        self.inflight = 0
+        self.cond = asyncio.Condition()
+        self.lastDecrease = 0
+        self.lastThroughput = 0
+        self.lastChange = 0
+        self._resetWindow()
+
+    def _resetWindow(self):
+        self.windowStart = time.monotonic()
+        self.completed = 0
+        self.errors = 0
+        self.bytes = 0
+
+    def _ceiling(self):
+        # 上限不超過本片在共用名額中分到的份量, 多出的請求只會在 budget 排隊
+        return min(self.maximum, self.budget.share()) if self.budget else self.maximum
+
+    def _set(self, limit, reason):
+        limit = max(self.minimum, min(self._ceiling(), limit))
+        if limit != self.limit:
+            print(f"\n[{self.label}] 並發 {self.limit} -> {limit} ({reason})")
+        self.lastChange = limit - self.limit
+        self.limit = limit
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.inflight < self.limit)
+            self.inflight += 1
+        return time.monotonic()
+
+    async def release(self, started, status, size):
+        async with self.cond:
+            self.inflight -= 1
+            self.completed += 1
+            self.bytes += size
+            if status in (429, 403):
+                self.errors += 1
+                if started > self.lastDecrease:
+                    self._set(self.limit // 2, f"伺服器限流 {status}")
+                    self.lastDecrease = time.monotonic()
+                    self._resetWindow()
+            elif status != 200:
+                self.errors += 1
+            if self.completed >= self.limit:
+                self._evaluate()
+            self.cond.notify_all()
+
+    def _evaluate(self):
+        elapsed = max(time.monotonic() - self.windowStart, 1e-6)
+        throughput = self.bytes / elapsed
+        if self.errors / self.completed > 0.1:
+            self._set(self.limit // 2, f"錯誤率 {self.errors}/{self.completed}")
+            self.lastDecrease = time.monotonic()
+        elif self.lastChange > 0 and throughput < self.lastThroughput * 0.9:
+            self._set(self.limit - 1, "吞吐量下降")
+        else:
+            self._set(self.limit + 1, f"{throughput / 1048576:.1f} MB/s")
+        self.lastThroughput = throughput
+        self._resetWindow()
@@ -0,0 +1,63 @@
+import os
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """記錄一部影片各階段的實際耗時與 CPU 時間
+
+    CPU 時間為執行該階段的 Python 執行緒所用的時間, 不含 Chrome 與 ffmpeg 等子行程;
+    實際耗時遠大於 CPU 時間表示該階段在等網路或外部程式.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.stages = {}  # 名稱 -> [實際耗時, CPU 時間, 次數], 依加入順序
+        self.lock = threading.Lock()
+
+    def add(self, name, wall, cpu):
+        with self.lock:
+            stage = self.stages.setdefault(name, [0.0, 0.0, 0])
+            stage[0] += wall
+            stage[1] += cpu
+            stage[2] += 1
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def report(self):
+        with self.lock:
+            stages = list(self.stages.items())
+        print(f"\n[{self.label}] 各階段耗時:")
+        print(f"  {'階段':<10}{'實際(秒)':>10}{'CPU(秒)':>10}{'次數':>8}")
+        for name, (wall, cpu, count) in stages:
+            print(f"  {name:<12}{wall:10.2f}{cpu:10.2f}{count:8}")
+
+
+@contextmanager
+def profiled(path):
+    """path 不為空時, 以 cProfile 記錄區塊內的呼叫並寫成 pstats 檔
+
+    Python 3.12 起 cProfile 改用整個行程共用的 sys.monitoring: 同一時間只能有一個
+    profiler (再啟用會 ValueError), 記錄也包含所有執行緒, 而不只本執行緒.
+    """
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        profiler.dump_stats(path)
+        print(f"\nprofile 已寫入 {path} (python -m pstats {os.path.basename(path)})")
@@ -0,0 +1,56 @@
+import atexit
+import threading
+import httpx
+from config import headers, POOL_SIZE, HTTP2, TIMEOUT
+
+# HTTP/2 需要額外安裝 h2 (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_client = None
+_lock = threading.Lock()
+
+
+def _options(pool_size):
+    """同步與非同步 client 共用的連線設定"""
+    http2 = HTTP2 and HTTP2_AVAILABLE
+    if HTTP2 and not HTTP2_AVAILABLE:
+        print("警告：未安裝 h2，改用 HTTP/1.1 連線。")
+    return {
+        "headers": headers,
+        "timeout": TIMEOUT,
+        "http2": http2,
+        "follow_redirects": True,
+        "limits": httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=30,
+        ),
+    }
+
+
+def get_client():
+    """取得全程共用的同步 client, 同一主機的請求重複使用 keep-alive 連線"""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(**_options(POOL_SIZE))
+    return _client
+
+
+def new_async_client(pool_size=POOL_SIZE):
+    """建立片段下載用的非同步 client (綁定在呼叫端的 event loop 上)"""
+    return httpx.AsyncClient(**_options(pool_size))
+
+
+@atexit.register
+def close():
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None